@@ -0,0 +1,53 @@
+"""
+Benchmark the capture codecs: encode time, decode time and encoded size
+of every codec and a few settings, on synthetic screenshots.
+
+    python -m benchmarks.bench_codecs
+"""
+import cv2 as cv
+import numpy as np
+
+from core.codec import CODEC_NAMES, Codec, get_codec
+from core.image_utils import decode_bytes_to_numpy
+from .synthetic import synthetic_screenshot
+from .utils import RESOLUTIONS, print_results, timeit
+
+
+def codecs() -> dict[str, Codec]:
+    """The configured codecs and the other settings worth comparing"""
+    variants = {name: get_codec(name) for name in CODEC_NAMES}
+    for level in (0, 3, 9):
+        variants[f"png-{level}"] = Codec("png", "image/png", ".png", (cv.IMWRITE_PNG_COMPRESSION, level))
+    for quality in (70, 95):
+        variants[f"jpeg-{quality}"] = Codec("jpeg", "image/jpeg", ".jpg", (cv.IMWRITE_JPEG_QUALITY, quality))
+    return variants
+
+
+def run(resolutions=("1080p", "4K"), repeat=5) -> dict:
+    results = {}
+    for name in resolutions:
+        image = synthetic_screenshot(*RESOLUTIONS[name])
+        for codec_name, codec in codecs().items():
+            encoded = codec.encode(image)
+            decoded = decode_bytes_to_numpy(encoded)
+            # Mean absolute error of the decoded pixels, 0 for lossless codecs
+            error = float(np.abs(decoded.astype(np.int16) - image).mean())
+
+            results[f"encode[{codec_name}][{name}]"] = {
+                **timeit(codec.encode, image, repeat=repeat),
+                "size_bytes": len(encoded),
+                "pixel_error": error,
+            }
+            results[f"decode[{codec_name}][{name}]"] = timeit(
+                decode_bytes_to_numpy, encoded, repeat=repeat
+            )
+    return results
+
+
+if __name__ == "__main__":
+    results = run()
+    print_results("Capture codecs", results)
+    print("Encoded sizes")
+    for case, result in results.items():
+        if "size_bytes" in result:
+            print(f"  {case:<40} {result['size_bytes'] / 1024:>10.0f} KiB (error {result['pixel_error']:.2f})")
@@ -0,0 +1,40 @@
+"""
+Benchmark deblot_image on screenshot sized masks.
+
+    python -m benchmarks.bench_deblot
+"""
+import numpy as np
+
+from core.image_utils import deblot_image
+from .utils import RESOLUTIONS, blob_mask, print_results, timeit
+
+
+def deblot_image_loop(mask: np.ndarray, min_size: float):
+    """The previous implementation, one full image comparison per blob"""
+    import cv2 as cv
+
+    nb_blobs, im_with_separated_blobs, stats, _ = cv.connectedComponentsWithStats(mask)
+    sizes = stats[1:, -1]
+    im_result = np.zeros((mask.shape))
+    for blob in range(nb_blobs - 1):
+        if sizes[blob] >= min_size:
+            im_result[im_with_separated_blobs == blob + 1] = 255
+    return im_result.astype(np.uint8)
+
+
+def run(repeat=5, baseline=True) -> dict:
+    results = {}
+    for name in ("1080p", "4K"):
+        mask = blob_mask(*RESOLUTIONS[name])
+        min_size = 50
+        assert np.array_equal(deblot_image(mask, min_size), deblot_image_loop(mask, min_size))
+        results[f"deblot_image[{name}]"] = timeit(deblot_image, mask, min_size, repeat=repeat)
+        if baseline:
+            results[f"deblot_image_loop[{name}]"] = timeit(
+                deblot_image_loop, mask, min_size, repeat=1
+            )
+    return results
+
+
+if __name__ == "__main__":
+    print_results("deblot_image", run())
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the Detector preprocessing on large crops.
+
+    python -m benchmarks.bench_detector_preprocess
+"""
+import tracemalloc
+
+import numpy as np
+
+from core.image_utils import ScratchBuffers, aspect_ratio_buckets, bucket_size
+from core.nudity import Detector
+from .utils import RESOLUTIONS, print_results, timeit
+
+
+def preprocess_convert_first(images, size):
+    """The previous implementation, float conversion before the resize"""
+    import cv2 as cv
+
+    batch = []
+    for image in images:
+        image = np.ascontiguousarray(image)[:, :, ::-1]
+        image = image.astype(np.float32)
+        image -= [103.939, 116.779, 123.68]
+        batch.append(cv.resize(image, (size[1], size[0])))
+    return np.asarray(batch)
+
+
+def peak_allocation_mb(func, *args) -> float:
+    """Peak memory allocated by numpy while running func"""
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def run(repeat=5) -> dict:
+    # Detector.preprocess doesn't need a loaded model
+    detector = Detector.__new__(Detector)
+    detector._buffers = ScratchBuffers()
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for name in ("1080p", "4K"):
+        width, height = RESOLUTIONS[name]
+        images = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(2)]
+        key = next(iter(aspect_ratio_buckets(images)))
+        size = bucket_size(key, min_side=480, max_side=800)
+
+        new = detector.preprocess(images, size)
+        old = preprocess_convert_first(images, size)
+        assert np.abs(new - old).max() < 1.0, "Preprocessing results differ"
+
+        for label, func in (
+            ("resize_first", lambda: detector.preprocess(images, size)),
+            ("convert_first", lambda: preprocess_convert_first(images, size)),
+        ):
+            timing = timeit(func, repeat=repeat)
+            timing["peak_mb"] = peak_allocation_mb(func)
+            results[f"detector_preprocess_{label}[{name}]"] = timing
+    return results
+
+
+if __name__ == "__main__":
+    results = run()
+    print_results("Detector preprocessing", results)
+    for case, timing in results.items():
+        print(f"  {case:<40} peak {timing['peak_mb']:.1f} MB")
@@ -0,0 +1,34 @@
+"""
+Benchmark the image helpers on synthetic screenshots.
+
+    python -m benchmarks.bench_image_utils
+"""
+from core.image_utils import (
+    contains_skin,
+    decode_base64_to_numpy,
+    encode_numpy_to_base64,
+    get_bounding_boxes,
+)
+from .synthetic import synthetic_screenshot
+from .utils import RESOLUTIONS, print_results, timeit
+
+
+def run(resolutions=("720p", "1080p", "4K"), repeat=5) -> dict:
+    results = {}
+    for name in resolutions:
+        image = synthetic_screenshot(*RESOLUTIONS[name])
+        encoded = encode_numpy_to_base64(image)
+
+        results[f"get_bounding_boxes[{name}]"] = timeit(get_bounding_boxes, image, repeat=repeat)
+        results[f"contains_skin[{name}]"] = timeit(contains_skin, image, repeat=repeat)
+        results[f"encode_numpy_to_base64[{name}]"] = timeit(
+            encode_numpy_to_base64, image, repeat=repeat
+        )
+        results[f"decode_base64_to_numpy[{name}]"] = timeit(
+            decode_base64_to_numpy, encoded, repeat=repeat
+        )
+    return results
+
+
+if __name__ == "__main__":
+    print_results("Image utils", run())
@@ -0,0 +1,91 @@
+"""
+Import-time budget of the Django project.
+
+Runs `python -X importtime` on the startup every management command goes
+through and fails when a heavy module is imported, or when the project's
+own modules take longer than the budget. Django, DRF and the standard
+library vary between machines and are reported but not budgeted.
+
+    python -m benchmarks.bench_import_time [--budget-ms 50]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules only needed to process screenshots
+HEAVY_MODULES = ("cv2", "numpy", "onnxruntime", "PIL")
+
+# Packages of the project, the only ones the budget applies to
+PROJECT_PACKAGES = ("core", "monitor", "openchaver")
+
+STARTUP = "import django; django.setup(); import core.models, core.admin, core.watchdog"
+
+
+def measure() -> dict:
+    """Import the project in a fresh interpreter and parse -X importtime"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="openchaver.settings")
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr)
+
+    modules = {}
+    own_time = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            # Nested imports are indented after the separator space
+            modules[name[1:]] = int(cumulative) / 1000
+            own_time[name.strip()] = int(own) / 1000
+
+    top_level = [ms for name, ms in modules.items() if not name.startswith(" ")]
+    return {
+        "total_ms": sum(top_level),
+        # Self time only, the libraries they import are not counted
+        "project_ms": sum(
+            ms for name, ms in own_time.items() if name.split(".")[0] in PROJECT_PACKAGES
+        ),
+        "heavy_modules": sorted(
+            name.strip() for name in modules if name.strip().split(".")[0] in HEAVY_MODULES
+        ),
+    }
+
+
+def run(budget_ms=None) -> dict:
+    result = measure()
+    return {"startup_imports": {**result, "budget_ms": budget_ms}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=50, help="Budget of the project's own modules")
+    args = parser.parse_args()
+
+    result = measure()
+    print(f"Startup imports: {result['total_ms']:.1f} ms")
+    print(f"Project modules: {result['project_ms']:.1f} ms (budget {args.budget_ms} ms)")
+
+    failed = False
+    if result["heavy_modules"]:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(result['heavy_modules'])}")
+        failed = True
+    if result["project_ms"] > args.budget_ms:
+        print("FAIL: project import time over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Benchmark the Classifier and the Detector with stand-in models.
+
+    python -m benchmarks.bench_inference
+"""
+import tempfile
+from pathlib import Path
+
+from core.image_utils import get_bounding_boxes
+from core.nudity import Classifier, Detector
+from .synthetic import standin_classifier, standin_detector, synthetic_screenshot
+from .utils import RESOLUTIONS, print_results, timeit
+
+
+def load_standin_models(directory: Path) -> tuple[Classifier, Detector]:
+    """Generate the stand-in models in directory and load them"""
+    classifier = Classifier(model_file=standin_classifier(directory / "classify.onnx"))
+    detector = Detector(model_file=standin_detector(directory / "detect.onnx"))
+    return classifier, detector
+
+
+def run(resolutions=("1080p", "4K"), repeat=5) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        classifier, detector = load_standin_models(Path(directory))
+        for name in resolutions:
+            image = synthetic_screenshot(*RESOLUTIONS[name])
+            crops = [image[y:y + h, x:x + w] for x, y, w, h in get_bounding_boxes(image)]
+            # Without crops the batched paths wouldn't be measured
+            assert len(crops) > 1, f"Found {len(crops)} crops in the synthetic {name} screenshot"
+
+            results[f"Classifier.classify[{name}, {len(crops)} crops]"] = timeit(
+                lambda: list(classifier.classify(crops)), repeat=repeat
+            )
+            results[f"Detector.detect[{name}, {len(crops)} crops, fast]"] = timeit(
+                detector.detect, crops, fast=True, repeat=repeat
+            )
+            results[f"Detector.detect[{name}, {len(crops)} crops, full]"] = timeit(
+                detector.detect, crops, fast=False, repeat=repeat
+            )
+    return results
+
+
+if __name__ == "__main__":
+    print_results("Inference", run())
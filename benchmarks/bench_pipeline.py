@@ -0,0 +1,86 @@
+"""
+Benchmark the full processing of an uploaded screenshot: the save that
+queues it and the worker processing it, on a temporary database with
+stand-in models.
+
+    python -m benchmarks.bench_pipeline
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from core.image_utils import encode_numpy_to_bytes
+from .synthetic import synthetic_screenshot
+from .utils import RESOLUTIONS, print_results, timeit
+
+
+def setup_django(db_path: Path):
+    """Set up Django on a fresh database at db_path"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "openchaver.settings")
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    django.setup()
+    call_command("migrate", verbosity=0)
+
+
+def run(resolutions=("1080p", "4K"), repeat=5) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        setup_django(directory / "db.sqlite3")
+
+        from core.cache import result_cache
+        from core.models import Screenshot
+        from core.nudity import get_classifier, get_detector, registry
+        from core.storage import image_store
+        from core.worker import claim_job, run_job
+        from openchaver.const import CLASSIFICATION_MODEL_PRECISION, DETECTION_MODEL_PRECISION
+        from .bench_inference import load_standin_models
+
+        image_store.root = directory / "images"
+        classifier, detector = load_standin_models(directory)
+        registry.register(("classifier", CLASSIFICATION_MODEL_PRECISION), classifier)
+        registry.register(("detector", DETECTION_MODEL_PRECISION), detector)
+        assert get_classifier() is classifier and get_detector() is detector
+
+        counter = iter(range(10**9))
+
+        def upload_and_process(encoded):
+            screenshot = Screenshot.objects.create(
+                title=f"Benchmark {next(counter)}",
+                excutable_name="benchmark.exe",
+                image_digest=image_store.put(encoded),
+                screenshot_type="NSFW_IMAGE",
+            )
+            while job := claim_job():
+                run_job(job)
+            return screenshot
+
+        def uncached(encoded):
+            result_cache.clear()
+            upload_and_process(encoded)
+
+        for name in resolutions:
+            encoded = encode_numpy_to_bytes(synthetic_screenshot(*RESOLUTIONS[name]))
+
+            # Make sure the pipeline reaches the models instead of timing
+            # a screenshot without crops
+            result_cache.clear()
+            screenshot = upload_and_process(encoded)
+            timings = Screenshot.objects.filter(pk=screenshot.pk).values_list("timings", flat=True).first()
+            assert timings and timings.get("crops", 0) > 1 and "classify" in timings, (
+                f"The synthetic {name} screenshot didn't reach the classifier: {timings}"
+            )
+
+            results[f"post_process[{name}]"] = timeit(uncached, encoded, repeat=repeat)
+            results[f"post_process_cached[{name}]"] = timeit(
+                upload_and_process, encoded, repeat=repeat
+            )
+    return results
+
+
+if __name__ == "__main__":
+    print_results("Screenshot pipeline", run())
@@ -0,0 +1,119 @@
+"""
+Benchmark the SQLite write throughput while other connections read, with
+the default settings and with the pragmas of openchaver.db.
+
+Every writer inserts one row per transaction, like a screenshot upload,
+and every reader runs the latest screenshots query of the admin.
+
+    python -m benchmarks.bench_sqlite
+"""
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from openchaver.const import SQLITE_PRAGMAS
+
+PREFILL_ROWS = 5000
+
+
+def connect(path: Path, pragmas: dict) -> sqlite3.Connection:
+    # Autocommit like Django, with the same default lock timeout
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+    return connection
+
+
+def create_database(path: Path, pragmas: dict):
+    connection = connect(path, pragmas)
+    connection.execute(
+        "CREATE TABLE screenshot (id INTEGER PRIMARY KEY, title TEXT, timestamp REAL, timings TEXT)"
+    )
+    connection.executemany(
+        "INSERT INTO screenshot (title, timestamp, timings) VALUES (?, ?, ?)",
+        ((f"Window {n}", time.time(), "{}" * 50) for n in range(PREFILL_ROWS)),
+    )
+    connection.close()
+
+
+def run_case(path: Path, pragmas: dict, writers=2, readers=4, duration=3.0) -> dict:
+    create_database(path, pragmas)
+    stop = threading.Event()
+    latencies = []
+    reads = [0] * readers
+    errors = [0]
+    lock = threading.Lock()
+
+    def write():
+        connection = connect(path, pragmas)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                connection.execute(
+                    "INSERT INTO screenshot (title, timestamp, timings) VALUES (?, ?, ?)",
+                    ("Benchmark", time.time(), "{}" * 50),
+                )
+            except sqlite3.OperationalError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+        connection.close()
+
+    def read(n):
+        connection = connect(path, pragmas)
+        while not stop.is_set():
+            try:
+                connection.execute(
+                    "SELECT id, title FROM screenshot ORDER BY timestamp DESC LIMIT 100"
+                ).fetchall()
+            except sqlite3.OperationalError:
+                with lock:
+                    errors[0] += 1
+                continue
+            reads[n] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=write) for _ in range(writers)]
+    threads += [threading.Thread(target=read, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "min_ms": min(latencies) if latencies else None,
+        "median_ms": float(np.median(latencies)) if latencies else None,
+        "max_ms": max(latencies) if latencies else None,
+        "repeat": len(latencies),
+        "writes_per_s": len(latencies) / duration,
+        "reads_per_s": sum(reads) / duration,
+        "lock_errors": errors[0],
+    }
+
+
+def run(writers=2, readers=4, duration=3.0) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        for name, pragmas in (("default", {}), ("tuned", SQLITE_PRAGMAS)):
+            results[f"sqlite_write[{name}]"] = run_case(
+                directory / f"{name}.sqlite3", pragmas, writers, readers, duration
+            )
+    return results
+
+
+if __name__ == "__main__":
+    print("SQLite concurrency")
+    for case, result in run().items():
+        print(
+            f"  {case:<24} {result['writes_per_s']:>8.0f} writes/s {result['reads_per_s']:>8.0f} reads/s"
+            f" median write {result['median_ms']:.2f} ms, {result['lock_errors']} lock errors"
+        )
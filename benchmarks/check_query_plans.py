@@ -0,0 +1,119 @@
+"""
+Check with EXPLAIN QUERY PLAN that the hot Screenshot and ProcessingJob
+queries use their indexes, without a table scan or a temporary sort.
+Exits with 1 when a query doesn't.
+
+    python -m benchmarks.check_query_plans
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from .bench_pipeline import setup_django
+
+# Rows of each table, enough for the planner to prefer an index to a scan
+ROWS = 2000
+
+
+def admin_queryset(model, **params):
+    """The queryset of the admin change list of model with the filters in params"""
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+
+    request = RequestFactory().get("/", params)
+    request.user = User(is_superuser=True, is_staff=True, is_active=True)
+    model_admin = admin.site._registry[model]
+    changelist = model_admin.get_changelist_instance(request)
+    return changelist.get_queryset(request)[:changelist.list_per_page]
+
+
+def queries() -> list:
+    """(name, queryset, expected index) of every checked query"""
+    from core.models import ProcessingJob, Screenshot, WindowSession
+
+    return [
+        # The admin cases run the exact queries of the change list, with the
+        # ordering it adds
+        (
+            "admin list",
+            admin_queryset(Screenshot),
+            "screenshot_ts_idx",
+        ),
+        (
+            "admin screenshot_type filter",
+            admin_queryset(Screenshot, screenshot_type__exact="NSFW"),
+            "screenshot_type_ts_idx",
+        ),
+        (
+            "admin is_nsfw filter",
+            admin_queryset(Screenshot, is_nsfw__exact="1"),
+            "screenshot_nsfw_ts_idx",
+        ),
+        (
+            "admin is_profane filter",
+            admin_queryset(Screenshot, is_profane__exact="1"),
+            "screenshot_profane_ts_idx",
+        ),
+        (
+            "claim_job",
+            ProcessingJob.objects.filter(status="PENDING").order_by("id")[:10],
+            "job_status_id_idx",
+        ),
+        (
+            "latest session in WindowSession.record_sample",
+            WindowSession.objects.order_by("-end").values("pk")[:1],
+            "session_end_idx",
+        ),
+    ]
+
+
+def fill_database():
+    """Insert rows without the post_save receiver queuing them"""
+    from django.utils import timezone
+    from core.models import ProcessingJob, Screenshot, WindowSession
+
+    types = [t for t, _ in Screenshot.TYPES]
+    Screenshot.objects.bulk_create(
+        Screenshot(
+            title=f"Window {n}",
+            excutable_name="check.exe",
+            screenshot_type=types[n % len(types)],
+            is_nsfw=n % 50 == 0,
+            is_profane=n % 40 == 0,
+        )
+        for n in range(ROWS)
+    )
+    ProcessingJob.objects.bulk_create(
+        ProcessingJob(screenshot_id=pk, status="PENDING" if pk % 10 else "FAILED")
+        for pk in Screenshot.objects.values_list("pk", flat=True)
+    )
+    now = timezone.now()
+    WindowSession.objects.bulk_create(
+        WindowSession(title=f"Window {n}", executable_name="check.exe", start=now, end=now)
+        for n in range(ROWS)
+    )
+
+
+def check() -> bool:
+    ok = True
+    for name, queryset, index in queries():
+        plan = queryset.explain()
+        # "USING INDEX" or "USING COVERING INDEX"
+        passed = f"INDEX {index}" in plan and "TEMP B-TREE" not in plan
+        ok &= passed
+        print(f"{'ok  ' if passed else 'FAIL'} {name}: expected {index}")
+        for line in plan.splitlines():
+            print(f"       {line}")
+    return ok
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(Path(directory) / "db.sqlite3")
+        fill_database()
+        return 0 if check() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
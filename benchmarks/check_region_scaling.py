@@ -0,0 +1,56 @@
+"""
+Check that get_bounding_boxes finds the same regions on a downscaled copy
+of the screenshot as at full resolution, on the synthetic screenshots.
+Exits with 1 when a box is missing or moved.
+
+    python -m benchmarks.check_region_scaling --max-side 1280
+"""
+import argparse
+import sys
+
+from core.image_utils import get_bounding_boxes
+from .synthetic import synthetic_screenshot
+from .utils import RESOLUTIONS
+
+# Minimum intersection over union of two boxes of the same region
+MIN_IOU = 0.9
+
+
+def iou(a: tuple, b: tuple) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = w * h
+    return intersection / (aw * ah + bw * bh - intersection)
+
+
+def compare(full: list, scaled: list) -> bool:
+    """Whether every box of full has exactly one match in scaled"""
+    if len(full) != len(scaled):
+        return False
+    return all(any(iou(a, b) >= MIN_IOU for b in scaled) for a in full)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-side", type=int, default=1280, help="analysis_max_side to check")
+    args = parser.parse_args()
+
+    ok = True
+    for texture in ("grain", "fine"):
+        for name, size in RESOLUTIONS.items():
+            image = synthetic_screenshot(*size, texture=texture)
+            full = get_bounding_boxes(image, analysis_max_side=None)
+            scaled = get_bounding_boxes(image, analysis_max_side=args.max_side)
+            passed = compare(full, scaled)
+            ok &= passed
+            print(
+                f"{'ok  ' if passed else 'FAIL'} {texture:<6} {name:<6}"
+                f" {len(full)} boxes at full resolution, {len(scaled)} at {args.max_side}"
+            )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Run the benchmark suite and store the results as JSON.
+
+    python -m benchmarks.run                     # Write benchmarks/results/<commit>.json
+    python -m benchmarks.run --quick             # Fewer resolutions and repeats
+    python -m benchmarks.run --compare A.json B.json
+
+Benchmarks needing the onnx and onnxruntime packages are skipped when they
+are not installed.
+"""
+import argparse
+import datetime
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# (module, required packages, kwargs, quick kwargs)
+BENCHMARKS = [
+    ("bench_image_utils", (), {}, {"resolutions": ("1080p",), "repeat": 2}),
+    ("bench_codecs", (), {}, {"resolutions": ("1080p",), "repeat": 2}),
+    ("bench_deblot", (), {"baseline": False}, {"baseline": False, "repeat": 2}),
+    ("bench_detector_preprocess", ("onnxruntime",), {}, {"repeat": 2}),
+    ("bench_inference", ("onnx", "onnxruntime"), {}, {"resolutions": ("1080p",), "repeat": 2}),
+    ("bench_sqlite", (), {}, {"duration": 1.0}),
+    ("bench_pipeline", ("onnx", "onnxruntime", "django"), {}, {"resolutions": ("1080p",), "repeat": 2}),
+]
+
+
+def git_commit() -> tuple[str, bool]:
+    """Current commit and whether the tree has local changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT, capture_output=True, text=True,
+        ).stdout.strip())
+        return commit or "unknown", dirty
+    except OSError:
+        return "unknown", False
+
+
+def missing_packages(packages) -> list[str]:
+    return [p for p in packages if importlib.util.find_spec(p) is None]
+
+
+def run(quick=False, only=None) -> dict:
+    """Run the benchmarks and return the results with the run metadata"""
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": quick,
+        "results": {},
+        "skipped": {},
+    }
+    for name, packages, kwargs, quick_kwargs in BENCHMARKS:
+        if only and name not in only:
+            continue
+        missing = missing_packages(packages)
+        if missing:
+            print(f"Skipping {name}: missing {', '.join(missing)}")
+            report["skipped"][name] = f"missing {', '.join(missing)}"
+            continue
+        print(f"Running {name}")
+        module = importlib.import_module(f"benchmarks.{name}")
+        report["results"].update(module.run(**(quick_kwargs if quick else kwargs)))
+    return report
+
+
+def compare(base: dict, new: dict):
+    """Print the median time of every case of two runs side by side"""
+    print(f"{'case':<50} {base['commit']:>12} {new['commit']:>12} {'ratio':>8}")
+    for case in sorted(set(base["results"]) | set(new["results"])):
+        a = base["results"].get(case, {}).get("median_ms")
+        b = new["results"].get(case, {}).get("median_ms")
+        ratio = f"{b / a:.2f}x" if a and b else "-"
+        a = f"{a:.2f}" if a is not None else "-"
+        b = f"{b:.2f}" if b is not None else "-"
+        print(f"{case:<50} {a:>12} {b:>12} {ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Fewer resolutions and repeats")
+    parser.add_argument("--only", nargs="*", help="Only run these benchmark modules")
+    parser.add_argument("--output", type=Path, help="Where to write the JSON results")
+    parser.add_argument("--compare", nargs="+", type=Path, metavar="JSON",
+                        help="Compare a stored run with another one or with a new run")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two result files")
+
+    if args.compare and len(args.compare) == 2:
+        base, new = (json.loads(p.read_text()) for p in args.compare)
+        compare(base, new)
+        return
+
+    report = run(quick=args.quick, only=args.only)
+    output = args.output or RESULTS_DIR / f"{report['commit']}{'-dirty' if report['dirty'] else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(json.loads(args.compare[0].read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
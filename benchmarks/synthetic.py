@@ -0,0 +1,185 @@
+"""
+Synthetic screenshots and stand-in models for the benchmarks.
+
+Nothing here needs the real NSFW models or a display, so the benchmarks
+run offline on any OS.
+"""
+from pathlib import Path
+
+import numpy as np
+
+# Number of boxes returned by the stand-in detector
+DETECTOR_BOXES = 100
+
+
+def synthetic_photo(width: int, height: int, rng, texture="grain") -> np.ndarray:
+    """
+    A skin colored BGR photo.
+    texture: "grain" for low frequency shading and per pixel grain like a
+    camera picture, "fine" for weak, blurred noise which region finding
+    only picks up at high resolutions
+    """
+    import cv2 as cv
+
+    if texture == "fine":
+        photo = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+        photo += np.array([90, 140, 200], dtype=np.uint8)
+        return cv.GaussianBlur(photo, (5, 5), 0)
+
+    shade = cv.resize(
+        rng.integers(-30, 30, (4, 4)).astype(np.float32), (width, height), interpolation=cv.INTER_CUBIC
+    )
+    grain = rng.normal(0, 18, (height, width)).astype(np.float32)
+    photo = np.array([110, 150, 210], dtype=np.float32) + (shade + grain)[:, :, None]
+    return np.clip(photo, 0, 255).astype(np.uint8)
+
+
+def synthetic_screenshot(width: int, height: int, photos=6, seed=0, texture="grain") -> np.ndarray:
+    """
+    A BGR screenshot of a flat UI with lines of "text" and a grid of
+    skin colored photos, see synthetic_photo for texture. With the default
+    texture get_bounding_boxes finds every photo at 720p and above.
+    """
+    import cv2 as cv
+
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 245, dtype=np.uint8)
+
+    # Header and side bar
+    cv.rectangle(image, (0, 0), (width, height // 12), (60, 60, 60), -1)
+    cv.rectangle(image, (0, height // 12), (width // 8, height), (230, 230, 230), -1)
+
+    # Lines of text
+    for y in range(height // 8, height, max(12, height // 60)):
+        x = width // 7
+        while x < width - 40:
+            word = int(rng.integers(10, 60))
+            cv.rectangle(image, (x, y), (x + word, y + 6), (30, 30, 30), -1)
+            x += word + 8
+
+    # Grid of photos
+    columns = max(1, int(np.ceil(np.sqrt(photos))))
+    rows = int(np.ceil(photos / columns))
+    cell_w = (width - width // 7) // columns
+    cell_h = (height - height // 8) // rows
+    for n in range(photos):
+        x = width // 7 + (n % columns) * cell_w + cell_w // 10
+        y = height // 8 + (n // columns) * cell_h + cell_h // 10
+        w, h = cell_w * 8 // 10, cell_h * 8 // 10
+        image[y:y + h, x:x + w] = synthetic_photo(w, h, rng, texture)
+    return image
+
+
+def _save(model, path: Path) -> Path:
+    import onnx
+
+    # The IR version of opset 13, newer onnx releases default to versions
+    # older onnxruntime releases can't load
+    model.ir_version = 7
+    onnx.checker.check_model(model)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save(model, str(path))
+    return path
+
+
+def standin_classifier(path: Path) -> Path:
+    """
+    A small convolutional network with the interface of the classification
+    model: NHWC float input of 224x224 and a [N, 2] softmax output.
+    Requires the onnx package.
+    """
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+
+    def weight(name, *shape):
+        return numpy_helper.from_array(rng.standard_normal(shape).astype(np.float32) * 0.1, name)
+
+    nodes = [
+        helper.make_node("Transpose", ["input"], ["nchw"], perm=[0, 3, 1, 2]),
+        helper.make_node("Conv", ["nchw", "w1", "b1"], ["c1"], kernel_shape=[3, 3], strides=[2, 2]),
+        helper.make_node("Relu", ["c1"], ["r1"]),
+        helper.make_node("Conv", ["r1", "w2", "b2"], ["c2"], kernel_shape=[3, 3], strides=[2, 2]),
+        helper.make_node("Relu", ["c2"], ["r2"]),
+        helper.make_node("GlobalAveragePool", ["r2"], ["pool"]),
+        helper.make_node("Flatten", ["pool"], ["flat"]),
+        helper.make_node("Gemm", ["flat", "w3", "b3"], ["logits"]),
+        helper.make_node("Softmax", ["logits"], ["output"], axis=1),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "standin_classifier",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 224, 224, 3])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["N", 2])],
+        [
+            weight("w1", 16, 3, 3, 3), weight("b1", 16),
+            weight("w2", 32, 16, 3, 3), weight("b2", 32),
+            weight("w3", 32, 2), weight("b3", 2),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    return _save(model, path)
+
+
+def standin_detector(path: Path, boxes=DETECTOR_BOXES) -> Path:
+    """
+    A small convolutional network with the interface of the detection
+    model: NHWC float input of any size and boxes [N, K, 4] float,
+    scores [N, K] float and labels [N, K] int32 outputs.
+    Requires the onnx package.
+    """
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+
+    def weight(name, *shape):
+        return numpy_helper.from_array(rng.standard_normal(shape).astype(np.float32) * 0.1, name)
+
+    def constant(name, value, dtype=np.float32):
+        return numpy_helper.from_array(np.array(value, dtype=dtype), name)
+
+    nodes = [
+        helper.make_node("Transpose", ["input"], ["nchw"], perm=[0, 3, 1, 2]),
+        helper.make_node("Conv", ["nchw", "w1", "b1"], ["c1"], kernel_shape=[3, 3], strides=[2, 2]),
+        helper.make_node("Relu", ["c1"], ["r1"]),
+        helper.make_node("Conv", ["r1", "w2", "b2"], ["c2"], kernel_shape=[3, 3], strides=[2, 2]),
+        helper.make_node("Relu", ["c2"], ["r2"]),
+        helper.make_node("GlobalAveragePool", ["r2"], ["pool"]),
+        helper.make_node("Flatten", ["pool"], ["flat"]),
+        # Boxes
+        helper.make_node("MatMul", ["flat", "w_boxes"], ["raw_boxes"]),
+        helper.make_node("Reshape", ["raw_boxes", "boxes_shape"], ["shaped_boxes"]),
+        helper.make_node("Abs", ["shaped_boxes"], ["abs_boxes"]),
+        helper.make_node("Mul", ["abs_boxes", "box_scale"], ["boxes"]),
+        # Scores
+        helper.make_node("MatMul", ["flat", "w_scores"], ["raw_scores"]),
+        helper.make_node("Sigmoid", ["raw_scores"], ["scores"]),
+        # Labels
+        helper.make_node("Mul", ["scores", "label_scale"], ["scaled_scores"]),
+        helper.make_node("Floor", ["scaled_scores"], ["floor_scores"]),
+        helper.make_node("Clip", ["floor_scores", "label_min", "label_max"], ["clipped"]),
+        helper.make_node("Cast", ["clipped"], ["labels"], to=TensorProto.INT32),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "standin_detector",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", "H", "W", 3])],
+        [
+            helper.make_tensor_value_info("boxes", TensorProto.FLOAT, ["N", boxes, 4]),
+            helper.make_tensor_value_info("scores", TensorProto.FLOAT, ["N", boxes]),
+            helper.make_tensor_value_info("labels", TensorProto.INT32, ["N", boxes]),
+        ],
+        [
+            weight("w1", 16, 3, 3, 3), weight("b1", 16),
+            weight("w2", 32, 16, 3, 3), weight("b2", 32),
+            weight("w_boxes", 32, boxes * 4),
+            weight("w_scores", 32, boxes),
+            constant("boxes_shape", [-1, boxes, 4], np.int64),
+            constant("box_scale", 100.0),
+            constant("label_scale", 16.0),
+            constant("label_min", 0.0),
+            constant("label_max", 15.0),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    return _save(model, path)
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+
+# Common capture resolutions (width, height)
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4K": (3840, 2160),
+}
+
+
+def timeit(func, *args, repeat=5, **kwargs) -> dict:
+    """Run func repeat times and return the timings in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": min(timings),
+        "median_ms": float(np.median(timings)),
+        "max_ms": max(timings),
+        "repeat": repeat,
+    }
+
+
+def blob_mask(width: int, height: int, blobs=2000, seed=0) -> np.ndarray:
+    """A binary mask with many small blobs and a few large ones"""
+    import cv2 as cv
+
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for _ in range(blobs):
+        x, y = int(rng.integers(width)), int(rng.integers(height))
+        cv.circle(mask, (x, y), int(rng.integers(1, 6)), 255, -1)
+    for _ in range(10):
+        x, y = int(rng.integers(width)), int(rng.integers(height))
+        cv.circle(mask, (x, y), int(rng.integers(40, 120)), 255, -1)
+    return mask
+
+
+def print_results(name: str, results: dict):
+    """Print the results of a benchmark as a table"""
+    print(name)
+    for case, timing in results.items():
+        print(f"  {case:<40} {timing['median_ms']:>10.2f} ms (min {timing['min_ms']:.2f})")
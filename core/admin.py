@@ -1,24 +1,56 @@
+import base64
+
 from django.contrib import admin
 
 # Register your models here.
-from .models import Screenshot
+from .models import Screenshot, ProcessingJob, StoredImage, WindowSession
+from .codec import sniff_mime_type
+from .storage import image_store
 # IMport the html template
 from django.utils.html import format_html
 
 class ScreenshotAdmin(admin.ModelAdmin):
-    list_display = ('title', 'excutable_name', 'screenshot_type','is_nsfw', 'is_profane', 'timestamp')
+    list_display = ('title', 'excutable_name', 'screenshot_type','is_nsfw', 'is_profane', 'processing_time', 'timestamp')
     search_fields = ('title', 'excutable_name')
     list_filter = ('screenshot_type', 'is_nsfw', 'is_profane', 'timestamp')
+    # Matches the indexes of Screenshot, the admin would add -pk anyway
+    ordering = ('-timestamp', '-pk')
     
-    # Show the image in the admin from the base64 string
-    readonly_fields = ('image',)
+    # Show the image in the admin from the image store
+    readonly_fields = ('image', 'image_digest', 'timings', 'processing_time')
 
     def image(self, obj):
 
-        if obj.base64_image:
-            return format_html('<img src="data:image/png;base64,{}" style="max-width: 300px; max-height: 300px;"/>', obj.base64_image)
+        if obj.image_digest and image_store.exists(obj.image_digest):
+            data = image_store.read(obj.image_digest)
+            mime_type = sniff_mime_type(data) or "image/png"
+            return format_html('<img src="data:{};base64,{}" style="max-width: 300px; max-height: 300px;"/>', mime_type, base64.b64encode(data).decode())
         return None
 
 
 
 admin.site.register(Screenshot, ScreenshotAdmin)
+
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('screenshot', 'status', 'attempts', 'created', 'updated')
+    list_filter = ('status',)
+
+
+admin.site.register(ProcessingJob, ProcessingJobAdmin)
+
+
+class StoredImageAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'size', 'refcount', 'created')
+
+
+admin.site.register(StoredImage, StoredImageAdmin)
+
+
+class WindowSessionAdmin(admin.ModelAdmin):
+    list_display = ('title', 'executable_name', 'start', 'end', 'duration', 'samples', 'is_profane')
+    search_fields = ('title', 'executable_name')
+    list_filter = ('is_profane', 'start')
+    ordering = ('-end',)
+
+
+admin.site.register(WindowSession, WindowSessionAdmin)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from openchaver.db import configure_sqlite
+
+        connection_created.connect(configure_sqlite, dispatch_uid="openchaver.db.configure_sqlite")
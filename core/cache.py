@@ -0,0 +1,56 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from openchaver.const import RESULT_CACHE_SIZE
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of inference results.
+    Keys are built from the model version and the digest or perceptual
+    hash of the image, so results are never reused across model changes.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value of key and mark it as recently used"""
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                value = None
+            else:
+                value = self._items[key]
+
+        if value is None:
+            CACHE_REQUESTS.inc(result="miss", kind=key[0])
+            return default
+        CACHE_REQUESTS.inc(result="hit", kind=key[0])
+        return value
+
+    def set(self, key, value):
+        """Cache value under key, evicting the least recently used entry"""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+result_cache = ResultCache(RESULT_CACHE_SIZE)
@@ -0,0 +1,70 @@
+"""
+Image codecs of the captured screenshots.
+
+The monitor encodes every capture with the codec configured for its
+screenshot type in CAPTURE_CODECS. The server decodes any of them, and
+finds the format of a stored image from its first bytes.
+"""
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from openchaver.const import CAPTURE_CODECS, JPEG_QUALITY, PNG_COMPRESSION
+
+# cv2 and numpy are imported on first encode, the admin only sniffs formats
+if TYPE_CHECKING:
+    import numpy as np
+
+CODEC_NAMES = ("png", "webp", "jpeg")
+
+
+class Codec:
+    """An image format and its encoder settings"""
+
+    def __init__(self, name: str, mime_type: str, extension: str, params: tuple = ()):
+        self.name = name
+        self.mime_type = mime_type
+        self.extension = extension
+        self.params = list(params)
+
+    def __repr__(self):
+        return f"Codec({self.name}, {self.params})"
+
+    def encode(self, img: "np.ndarray") -> bytes:
+        """Encode a numpy array to the bytes of this format"""
+        import cv2 as cv
+
+        ok, buffer = cv.imencode(self.extension, img, self.params)
+        if not ok:
+            raise ValueError(f"Failed to encode the image as {self.name}")
+        return buffer.tobytes()
+
+
+@lru_cache(maxsize=None)
+def get_codec(name: str) -> Codec:
+    """The codec called name, one of CODEC_NAMES"""
+    import cv2 as cv
+
+    if name == "png":
+        return Codec("png", "image/png", ".png", (cv.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION))
+    if name == "webp":
+        # A quality above 100 selects lossless WebP
+        return Codec("webp", "image/webp", ".webp", (cv.IMWRITE_WEBP_QUALITY, 101))
+    if name == "jpeg":
+        return Codec("jpeg", "image/jpeg", ".jpg", (cv.IMWRITE_JPEG_QUALITY, JPEG_QUALITY))
+    raise ValueError(f"Unknown codec {name}, expected one of {CODEC_NAMES}")
+
+
+def codec_for(screenshot_type: str) -> Codec:
+    """The codec of the captures of a screenshot type"""
+    return get_codec(CAPTURE_CODECS.get(screenshot_type, "png"))
+
+
+def sniff_mime_type(data: bytes) -> str | None:
+    """Mime type of encoded image bytes from their signature"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
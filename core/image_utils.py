@@ -2,17 +2,37 @@ import logging
 
 import cv2 as cv
 import base64
+import math
+import threading
+from functools import cached_property
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
+def encode_numpy_to_bytes(img: np.ndarray, codec: str = "png") -> bytes:
+    """
+    Encode a numpy array with one of the codecs of core.codec.
+    """
+    from .codec import get_codec
+
+    return get_codec(codec).encode(img)
+
+
+def decode_bytes_to_numpy(data: bytes) -> np.ndarray:
+    """
+    Decode encoded image bytes to a numpy array.
+    """
+
+    return cv.imdecode(np.frombuffer(data, np.uint8), -1)
+
+
 def encode_numpy_to_base64(img: np.ndarray) -> str:
     """
     Encode a numpy array to base64.
     """
 
-    return base64.b64encode(cv.imencode(".png", img)[1]).decode()
+    return base64.b64encode(encode_numpy_to_bytes(img)).decode()
 
 
 def decode_base64_to_numpy(str: str) -> np.ndarray:
@@ -20,7 +40,18 @@ def decode_base64_to_numpy(str: str) -> np.ndarray:
     Decode a base64 string to a numpy array.
     """
 
-    return cv.imdecode(np.frombuffer(base64.b64decode(str), np.uint8), -1)
+    return decode_bytes_to_numpy(base64.b64decode(str))
+
+
+def perceptual_hash(img: np.ndarray, hash_size=16) -> str:
+    """
+    Difference hash of an image.
+    Near identical images (re-encoded, slightly changed) share the same hash
+    """
+    gray = img if img.ndim == 2 else cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+    small = cv.resize(gray, (hash_size + 1, hash_size), interpolation=cv.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits).tobytes().hex()
 
 
 def color_in_image(img: np.ndarray) -> bool:
@@ -33,8 +64,6 @@ def color_in_image(img: np.ndarray) -> bool:
 
 def deblot_image(mask: np.ndarray, min_size: float):
     """Remove small blobs from an image."""
-    import cv2 as cv
-
     (
         nb_blobs,
         im_with_separated_blobs,
@@ -43,30 +72,28 @@ def deblot_image(mask: np.ndarray, min_size: float):
     ) = cv.connectedComponentsWithStats(  # noqa E501
         mask
     )
-    sizes = stats[:, -1]
-    sizes = sizes[1:]
-    nb_blobs -= 1
-    im_result = np.zeros((mask.shape))
-    for blob in range(nb_blobs):
-        if sizes[blob] >= min_size:
-            im_result[im_with_separated_blobs == blob + 1] = 255
-    mask = im_result.astype(np.uint8)
-    return mask
+    # Lookup table mapping every blob label to 255 if it is kept, else 0
+    lut = np.where(stats[:, cv.CC_STAT_AREA] >= min_size, 255, 0).astype(np.uint8)
+    lut[0] = 0  # Background
+    return lut[im_with_separated_blobs]
 
 
-def count_skin_pixels(image: np.ndarray):
-    """Count the number of pixels in the image which are skin colored"""
-    import cv2 as cv
-
+def skin_mask(image: np.ndarray, hsv: np.ndarray | None = None) -> np.ndarray:
+    """Mask of the pixels in the image which are skin colored"""
     lower = np.array([0, 48, 80], dtype="uint8")
     upper = np.array([20, 255, 255], dtype="uint8")
-    converted = cv.cvtColor(image, cv.COLOR_BGR2HSV)
+    converted = cv.cvtColor(image, cv.COLOR_BGR2HSV) if hsv is None else hsv
     skin_mask = cv.inRange(converted, lower, upper)
     kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (11, 11))
     skin_mask = cv.erode(skin_mask, kernel, iterations=2)
     skin_mask = cv.dilate(skin_mask, kernel, iterations=2)
     skin_mask = deblot_image(skin_mask, 250)
-    return np.sum(skin_mask)
+    return skin_mask
+
+
+def count_skin_pixels(image: np.ndarray):
+    """Count the number of pixels in the image which are skin colored"""
+    return np.sum(skin_mask(image))
 
 
 def contains_skin(img: np.ndarray, thresh=1.5) -> bool:
@@ -85,30 +112,106 @@ def contains_skin(img: np.ndarray, thresh=1.5) -> bool:
     return skin_ratio > thresh
 
 
-def get_bounding_boxes(image: np.ndarray) -> list:
-    # Check if there are skin pixels in the image
-    # This is done to remove images that are definitely not NSFW
-    if not contains_skin(image, thresh=0.5):
-        logger.debug("Image does not contain skin. Skipping...")
-        return []
+class SkinMap:
+    """
+    Skin and color masks of a whole image stored as summed-area tables.
+    The skin ratio of any box is an O(1) lookup instead of
+    running contains_skin on a crop of the image.
+    """
+
+    def __init__(self, image: np.ndarray, mask: np.ndarray | None = None):
+        if mask is None:
+            mask = skin_mask(image)
+        self.skin = cv.integral((mask > 0).view(np.uint8))
+        color = (image[:, :, 0] != image[:, :, 1]) | (image[:, :, 1] != image[:, :, 2])
+        self.color = cv.integral(color.view(np.uint8))
+
+    @staticmethod
+    def _sum(table: np.ndarray, x: int, y: int, w: int, h: int) -> int:
+        return int(table[y + h, x + w] - table[y, x + w] - table[y + h, x] + table[y, x])
+
+    def skin_ratio(self, x: int, y: int, w: int, h: int) -> float:
+        """
+        Skin ratio of a box, on the same scale as contains_skin
+        (the sum of the 0/255 mask divided by the area)
+        """
+        return 255 * self._sum(self.skin, x, y, w, h) / (w * h)
+
+    def contains_skin(self, x: int, y: int, w: int, h: int, thresh=1.5) -> bool:
+        """Check if the box contains skin beyond a certain threshold"""
+        # Return True if the box is completely black and white
+        if self._sum(self.color, x, y, w, h) == 0:
+            return True
+        return self.skin_ratio(x, y, w, h) > thresh
+
+
+# Regions can be searched on a copy of the image downscaled to this size.
+# Downscaling averages away the fine texture the region search relies on,
+# so it is off until `python -m benchmarks.check_region_scaling` passes
+# for the chosen size.
+ANALYSIS_MAX_SIDE = None
+
+
+class ScratchBuffers(threading.local):
+    """Per thread scratch arrays reused between calls"""
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        array = self.arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = np.empty(shape, dtype=dtype)
+            self.arrays[name] = array
+        return array
+
+
+_buffers = ScratchBuffers()
+
+
+def neighbour_difference(gray: np.ndarray) -> np.ndarray:
+    """
+    Product of the differences between every pixel and its 4 neighbours
+    (wrapping around the edges, in uint8 arithmetic).
+    The result is a per thread buffer which is overwritten by the next call.
+    """
+    diff = _buffers.get("diff", gray.shape)
+    tmp = _buffers.get("tmp", gray.shape)
+
+    # Right neighbour difference
+    np.subtract(gray[:, 1:], gray[:, :-1], out=diff[:, 1:])
+    np.subtract(gray[:, :1], gray[:, -1:], out=diff[:, :1])
+
+    # Left neighbour difference
+    np.subtract(gray[:, :-1], gray[:, 1:], out=tmp[:, :-1])
+    np.subtract(gray[:, -1:], gray[:, :1], out=tmp[:, -1:])
+    np.multiply(diff, tmp, out=diff)
+
+    # Upper neighbour difference
+    np.subtract(gray[1:], gray[:-1], out=tmp[1:])
+    np.subtract(gray[:1], gray[-1:], out=tmp[:1])
+    np.multiply(diff, tmp, out=diff)
+
+    # Lower neighbour difference
+    np.subtract(gray[:-1], gray[1:], out=tmp[:-1])
+    np.subtract(gray[-1:], gray[:1], out=tmp[-1:])
+    np.multiply(diff, tmp, out=diff)
+    return diff
+
+
+def find_image_regions(image: np.ndarray, gray: np.ndarray | None = None) -> list:
+    """Find the boxes of the individual images inside a screenshot"""
 
     # Remove all parts of the image that are
     # very similar to their neighbors
-    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
-    shift_r = np.roll(gray, 1, axis=1)
-    shift_l = np.roll(gray, 1 * -1, axis=1)
-    shift_u = np.roll(gray, 1, axis=0)
-    shift_d = np.roll(gray, 1 * -1, axis=0)
-    diff_r = np.absolute(gray - shift_r)
-    diff_l = np.absolute(gray - shift_l)
-    diff_u = np.absolute(gray - shift_u)
-    diff_d = np.absolute(gray - shift_d)
-    diff = diff_r * diff_l * diff_u * diff_d
+    if gray is None:
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    diff = neighbour_difference(gray)
     _, mask = cv.threshold(diff, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
 
     # Kernel for morphological operations
     # Relative to the size of the image
-    kernel_size = int(image.shape[0] * 0.005)
+    kernel_size = max(1, int(image.shape[0] * 0.005))
     kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kernel_size, kernel_size))
 
     # Morphological operations on the mask
@@ -122,16 +225,48 @@ def get_bounding_boxes(image: np.ndarray) -> list:
     mask = cv.morphologyEx(mask, cv.MORPH_CLOSE, kernel, iterations=1)
 
     # Apply the mask to the image
-    masked_image = cv.bitwise_and(image, image, mask=mask)
+    masked = cv.bitwise_and(gray, gray, mask=mask)
 
     # Detect individual images
+    contours, _ = cv.findContours(masked, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+    return [cv.boundingRect(c) for c in contours if cv.contourArea(c) > min_size]
+
+
+def get_bounding_boxes(
+    image: np.ndarray,
+    skin_map: SkinMap | None = None,
+    analysis_max_side: int | None = ANALYSIS_MAX_SIDE,
+    gray: np.ndarray | None = None,
+) -> list:
+    # The skin mask is computed once for the whole image and
+    # reused for every candidate box
+    if skin_map is None:
+        skin_map = SkinMap(image)
+    height, width = image.shape[:2]
+
+    # Check if there are skin pixels in the image
+    # This is done to remove images that are definitely not NSFW
+    if not skin_map.contains_skin(0, 0, width, height, thresh=0.5):
+        logger.debug("Image does not contain skin. Skipping...")
+        return []
+
+    # Find the regions on a downscaled copy of large images
+    # and map them back to the full resolution
+    scale = 1.0
+    if analysis_max_side and max(height, width) > analysis_max_side:
+        scale = analysis_max_side / max(height, width)
+        small = cv.resize(image, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+        gray = None
+    else:
+        small = image
+
     max_aspect_ratio = 3
-    gray = cv.cvtColor(masked_image, cv.COLOR_BGR2GRAY)
-    contours, _ = cv.findContours(gray, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-    contours = [c for c in contours if cv.contourArea(c) > min_size]
     bounding_boxes = []
-    for cnt in contours:
-        x, y, w, h = cv.boundingRect(cnt)
+    for x, y, w, h in find_image_regions(small, gray):
+        if scale != 1.0:
+            x, y = int(x / scale), int(y / scale)
+            w = min(width - x, math.ceil(w / scale))
+            h = min(height - y, math.ceil(h / scale))
         # If the images aspect ratio is very narrow or very wide, skip it
         if w / h > max_aspect_ratio or w / h < max_aspect_ratio * 0.1:
             continue
@@ -140,14 +275,52 @@ def get_bounding_boxes(image: np.ndarray) -> list:
     filtered_bounding_boxes = []  # Images with a skin ratio above 5
 
     for x, y, w, h in bounding_boxes:
-        sub_image = image[y : y + h, x : x + w]
-        if contains_skin(sub_image, thresh=5):
+        if skin_map.contains_skin(x, y, w, h, thresh=5):
             filtered_bounding_boxes.append((x, y, w, h))
 
     logger.debug(f"Found {len(filtered_bounding_boxes)} images")
 
     return filtered_bounding_boxes
 
+class ImageContext:
+    """
+    The decoded image of a screenshot and the conversions derived from it.
+    Every processing stage shares the same arrays, so the image is decoded
+    and converted at most once. decodes counts the actual decodes.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.decodes = 0
+
+    @cached_property
+    def image(self) -> np.ndarray:
+        self.decodes += 1
+        image = decode_bytes_to_numpy(self.data)
+        if image is None:
+            raise ValueError(f"Failed to decode the image ({len(self.data)} bytes, not a supported image format)")
+        return image
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv.cvtColor(self.image, cv.COLOR_BGR2GRAY)
+
+    @cached_property
+    def hsv(self) -> np.ndarray:
+        return cv.cvtColor(self.image, cv.COLOR_BGR2HSV)
+
+    @cached_property
+    def skin_mask(self) -> np.ndarray:
+        return skin_mask(self.image, self.hsv)
+
+    @cached_property
+    def skin_map(self) -> SkinMap:
+        return SkinMap(self.image, self.skin_mask)
+
+    def bounding_boxes(self) -> list:
+        """Bounding boxes of the images in the screenshot"""
+        return get_bounding_boxes(self.image, self.skin_map, gray=self.gray)
+
 def match_size(images: list[np.ndarray]) -> list[np.ndarray]:
     """
     Resize images to the size of the largest
@@ -172,6 +345,26 @@ def match_size(images: list[np.ndarray]) -> list[np.ndarray]:
             resized_images.append(img)
     return resized_images
 
+def aspect_ratio_buckets(images: list[np.ndarray], step=0.25) -> dict[int, list[int]]:
+    """
+    Group the indices of images whose aspect ratios are close.
+    Bucket k holds the images with a width/height ratio near 2 ** (k * step)
+    """
+    buckets = {}
+    for i, img in enumerate(images):
+        key = round(math.log2(img.shape[1] / img.shape[0]) / step)
+        buckets.setdefault(key, []).append(i)
+    return buckets
+
+def bucket_size(key: int, step=0.25, min_side=800, max_side=1333) -> tuple[int, int]:
+    """Compute the (height, width) every image in a bucket is resized to"""
+    ratio = 2 ** (key * step)
+    rows, cols = (1000, 1000 * ratio) if ratio >= 1 else (1000 / ratio, 1000)
+    scale = compute_resize_scale((rows, cols, 3),
+                                 min_side=min_side,
+                                 max_side=max_side)
+    return max(1, round(rows * scale)), max(1, round(cols * scale))
+
 def compute_resize_scale(image_shape, min_side=800, max_side=1333):
     """Compute the scale to resize an image to a given size"""
     (rows, cols, _) = image_shape
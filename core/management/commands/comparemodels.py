@@ -0,0 +1,91 @@
+import logging
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+def timed(func, *args, **kwargs):
+    """Run func and return its result and the wall time in milliseconds"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = "Compare the speed and the outputs of the fp32 and int8 NSFW models"
+
+    def add_arguments(self, parser):
+        parser.add_argument("images", type=Path, help="Directory of images to run the models on")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per image, the fastest is kept")
+        parser.add_argument("--threshold", type=float, default=0.6, help="Classifier NSFW threshold")
+
+    def handle(self, *args, **options):
+        import cv2 as cv
+        from core.nudity import Classifier, Detector
+
+        paths = sorted(
+            p for p in options["images"].glob("*") if p.suffix.lower() in IMAGE_EXTENSIONS
+        )
+        images = [cv.imread(str(p)) for p in paths]
+        images = [img for img in images if img is not None]
+        if not images:
+            raise CommandError(f"No images found in {options['images']}")
+
+        repeat = options["repeat"]
+        threshold = options["threshold"]
+        self.stdout.write(f"Comparing on {len(images)} images, best of {repeat} runs")
+
+        # Classifier
+        classifiers = {p: Classifier(p) for p in ("fp32", "int8")}
+        scores = {p: [] for p in classifiers}
+        latency = {p: [] for p in classifiers}
+        for img in images:
+            for precision, classifier in classifiers.items():
+                runs = [timed(classifier.scores, [img]) for _ in range(repeat)]
+                scores[precision].append(runs[0][0][0])
+                latency[precision].append(min(t for _, t in runs))
+
+        agree = sum(
+            (a > threshold) == (b > threshold) for a, b in zip(scores["fp32"], scores["int8"])
+        )
+        diff = sum(abs(a - b) for a, b in zip(scores["fp32"], scores["int8"])) / len(images)
+        self.stdout.write("\nClassifier")
+        for precision in classifiers:
+            self.stdout.write(
+                f"  {precision}: {sum(latency[precision]) / len(images):.1f} ms/image"
+            )
+        self.stdout.write(f"  Label agreement: {agree}/{len(images)} ({agree / len(images):.1%})")
+        self.stdout.write(f"  Mean score difference: {diff:.4f}")
+
+        # Detector
+        detectors = {p: Detector(p) for p in ("fp32", "int8")}
+        results = {p: [] for p in detectors}
+        latency = {p: [] for p in detectors}
+        for img in images:
+            for precision, detector in detectors.items():
+                runs = [timed(detector.is_nsfw, img) for _ in range(repeat)]
+                results[precision].append(runs[0][0])
+                latency[precision].append(min(t for _, t in runs))
+
+        agree = sum(
+            a["is_nsfw"] == b["is_nsfw"] for a, b in zip(results["fp32"], results["int8"])
+        )
+        # Jaccard similarity of the detected labels
+        similarity = 0
+        for a, b in zip(results["fp32"], results["int8"]):
+            labels_a = {d["label"] for d in a["detections"]}
+            labels_b = {d["label"] for d in b["detections"]}
+            union = labels_a | labels_b
+            similarity += len(labels_a & labels_b) / len(union) if union else 1
+        self.stdout.write("\nDetector")
+        for precision in detectors:
+            self.stdout.write(
+                f"  {precision}: {sum(latency[precision]) / len(images):.1f} ms/image"
+            )
+        self.stdout.write(f"  NSFW agreement: {agree}/{len(images)} ({agree / len(images):.1%})")
+        self.stdout.write(f"  Mean label similarity: {similarity / len(images):.3f}")
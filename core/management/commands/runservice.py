@@ -1,18 +1,48 @@
 import logging
+import threading
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
 from core.watchdog import keep_monitor_alive, keep_watcher_alive
+from core.worker import requeue_interrupted_jobs, worker_services
 from openchaver.utils import thread_runner
-from openchaver.const import PORT
+from openchaver.const import PORT, WORKER_COUNT, WORKER_MODE
 
 logger = logging.getLogger(__name__)
 
 
+def warm_up():
+    """Load the models in the background, the first run downloads them"""
+    from core.nudity import warm_up_models
+
+    try:
+        warm_up_models()
+    except:  # noqa: E722
+        logger.exception("Failed to warm up the NSFW models")
+
 
 class Command(BaseCommand):
     help = "Run the main service"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=WORKER_COUNT,
+            help="Number of workers processing the uploaded screenshots",
+        )
+        parser.add_argument(
+            "--worker-mode",
+            choices=["thread", "process"],
+            default=WORKER_MODE,
+            help="Run the workers as threads of the service or as separate processes",
+        )
+
     def handle(self, *args, **options):
+        # Load the models before the first screenshot arrives, without
+        # holding back the server. Worker processes load their own models.
+        if options["worker_mode"] == "thread":
+            threading.Thread(target=warm_up, name="Model warm-up", daemon=True).start()
+
         # Start the server on a separate thread
         services = {
             # Server
@@ -38,6 +68,11 @@ class Command(BaseCommand):
             },
 
         }
+
+        # Workers processing the queued screenshots
+        requeue_interrupted_jobs()
+        services.update(worker_services(options["workers"], options["worker_mode"]))
+
         thread_runner(services)
 
 
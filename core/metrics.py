@@ -0,0 +1,224 @@
+"""
+In-process metrics exposed in the Prometheus text format at /api/metrics/.
+
+Recording a value is a dict update under a lock, cheap enough for the
+processing hot path. Worker processes send their metrics to the service,
+which adds them to its own when rendering.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    labels = key + extra
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Every metric of the process and the latest state sent by each worker process"""
+
+    def __init__(self):
+        self.metrics = []
+        self._remote = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def export(self) -> dict:
+        """State of the counters and histograms, to be sent to the service"""
+        return {m.name: m.state() for m in self.metrics if not isinstance(m, Gauge)}
+
+    def merge_remote(self, source, states: dict):
+        """Store the latest state sent by a worker process"""
+        with self._lock:
+            self._remote[source] = states
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        with self._lock:
+            remote = list(self._remote.values())
+
+        lines = []
+        for metric in self.metrics:
+            states = [metric.state()] + [r[metric.name] for r in remote if metric.name in r]
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            try:
+                lines.extend(metric.render(states))
+            except Exception:
+                logger.exception(f"Failed to collect the metric {metric.name}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class Counter:
+    """A value that only goes up"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, states: list) -> list[str]:
+        values = {}
+        for state in states:
+            for key, value in state.items():
+                values[key] = values.get(key, 0) + value
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, **labels):
+        key = _labels_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the time spent in the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {k: [list(counts), total, count] for k, (counts, total, count) in self._values.items()}
+
+    def render(self, states: list) -> list[str]:
+        values = {}
+        for state in states:
+            for key, (counts, total, count) in state.items():
+                entry = values.setdefault(key, [[0] * len(counts), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Gauge:
+    """A value computed when the metrics are scraped"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        registry.register(self)
+
+    def state(self):
+        return None
+
+    def render(self, states: list) -> list[str]:
+        value = self.callback()
+        # Labeled gauges return a dict of labels key to value
+        if isinstance(value, dict):
+            return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in value.items()]
+        return [f"{self.name} {_format_value(value)}"]
+
+
+def pending_jobs() -> dict:
+    """Number of queued jobs by status"""
+    from django.db.models import Count
+    from .models import ProcessingJob
+
+    counts = {status: 0 for status, _ in ProcessingJob.STATUSES}
+    for row in ProcessingJob.objects.values("status").annotate(count=Count("id")):
+        counts[row["status"]] = row["count"]
+    return {(("status", status),): count for status, count in counts.items()}
+
+
+def database_size() -> int:
+    """Size of the SQLite database and its journal files"""
+    from pathlib import Path
+    from django.conf import settings
+
+    path = Path(settings.DATABASES["default"]["NAME"])
+    return sum(
+        p.stat().st_size for p in (path, Path(f"{path}-wal"), Path(f"{path}-shm")) if p.exists()
+    )
+
+
+INGEST_REQUESTS = Counter("openchaver_ingest_requests_total", "Screenshot uploads received")
+INGEST_SECONDS = Histogram("openchaver_ingest_seconds", "Time to handle a screenshot upload")
+STAGE_SECONDS = Histogram("openchaver_stage_seconds", "Time spent in each processing stage of a screenshot")
+PROCESSING_SECONDS = Histogram("openchaver_processing_seconds", "Total processing time of a screenshot")
+JOBS = Counter("openchaver_jobs_total", "Processing jobs handled by the workers")
+CACHE_REQUESTS = Counter("openchaver_cache_requests_total", "NSFW result cache lookups")
+JOBS_QUEUED = Gauge("openchaver_jobs", "Processing jobs in the queue", pending_jobs)
+DATABASE_BYTES = Gauge("openchaver_database_bytes", "Size of the database files", database_size)
+
+
+def observe_timings(timer, screenshot_type: str):
+    """Record the stage timings of a processed screenshot"""
+    for stage, ms in timer.stages.items():
+        STAGE_SECONDS.observe(ms / 1000, stage=stage)
+    PROCESSING_SECONDS.observe(timer.total / 1000, type=screenshot_type)
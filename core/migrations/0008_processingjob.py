@@ -0,0 +1,26 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_remove_screenshot_binary_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.TextField(choices=[('PENDING', 'PENDING'), ('RUNNING', 'RUNNING'), ('FAILED', 'FAILED')], default='PENDING')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('screenshot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='core.screenshot')),
+            ],
+        ),
+    ]
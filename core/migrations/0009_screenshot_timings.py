@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screenshot',
+            name='processing_time',
+            field=models.FloatField(blank=True, help_text='Total processing time in milliseconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='screenshot',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict, help_text='Processing time of every stage in milliseconds', null=True),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 4.1.3 on 2026-10-18 13:05
+
+import base64
+import binascii
+import logging
+from collections import Counter
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# Rows loaded at once while moving the images
+BATCH_SIZE = 100
+
+
+def move_images_to_store(apps, schema_editor):
+    """Write the base64 images to the image store and keep their digest"""
+    from core.storage import image_store
+
+    Screenshot = apps.get_model("core", "Screenshot")
+    StoredImage = apps.get_model("core", "StoredImage")
+
+    refcounts = Counter()
+    sizes = {}
+    pks = list(
+        Screenshot.objects.exclude(base64_image=None)
+        .exclude(base64_image="")
+        .values_list("pk", flat=True)
+    )
+    for start in range(0, len(pks), BATCH_SIZE):
+        batch = Screenshot.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).only("pk", "base64_image")
+        for screenshot in list(batch):
+            try:
+                data = base64.b64decode(screenshot.base64_image)
+            except (binascii.Error, ValueError):
+                logger.warning(f"Dropping the invalid image of screenshot {screenshot.pk}")
+                continue
+            digest = image_store.write_file(data)
+            refcounts[digest] += 1
+            sizes[digest] = len(data)
+            Screenshot.objects.filter(pk=screenshot.pk).update(image_digest=digest)
+
+    StoredImage.objects.bulk_create(
+        [StoredImage(digest=d, size=sizes[d], refcount=n) for d, n in refcounts.items()],
+        batch_size=500,
+    )
+    if pks:
+        logger.info(f"Moved {len(pks)} images to {image_store.root}")
+
+
+def move_images_to_database(apps, schema_editor):
+    """Put the stored images back in the rows. The files are kept."""
+    from core.storage import image_store
+
+    Screenshot = apps.get_model("core", "Screenshot")
+
+    pks = list(Screenshot.objects.exclude(image_digest=None).values_list("pk", flat=True))
+    for start in range(0, len(pks), BATCH_SIZE):
+        batch = Screenshot.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).only("pk", "image_digest")
+        for screenshot in list(batch):
+            if not image_store.exists(screenshot.image_digest):
+                continue
+            data = base64.b64encode(image_store.read(screenshot.image_digest)).decode()
+            Screenshot.objects.filter(pk=screenshot.pk).update(base64_image=data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_screenshot_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveIntegerField(help_text='Size of the file in bytes')),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='screenshot',
+            name='image_digest',
+            field=models.CharField(blank=True, help_text='SHA-256 digest of the image in the image store', max_length=64, null=True),
+        ),
+        migrations.RunPython(move_images_to_store, move_images_to_database),
+        migrations.RemoveField(
+            model_name='screenshot',
+            name='base64_image',
+        ),
+    ]
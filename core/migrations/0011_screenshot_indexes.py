@@ -0,0 +1,33 @@
+# Generated by Django 4.1.3 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_image_store'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='screenshot',
+            index=models.Index(fields=['-timestamp', '-id'], name='screenshot_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='screenshot',
+            index=models.Index(fields=['screenshot_type', '-timestamp', '-id'], name='screenshot_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='screenshot',
+            index=models.Index(condition=models.Q(('is_nsfw', True)), fields=['-timestamp', '-id'], name='screenshot_nsfw_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='screenshot',
+            index=models.Index(condition=models.Q(('is_profane', True)), fields=['-timestamp', '-id'], name='screenshot_profane_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processingjob',
+            index=models.Index(fields=['status', 'id'], name='job_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 4.1.3 on 2026-10-18 15:10
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+# SESSION_GAP when the sessions were introduced
+SESSION_GAP = timedelta(seconds=10)
+
+# Sessions inserted at once
+BATCH_SIZE = 500
+
+
+def collapse_meta_screenshots(apps, schema_editor):
+    """
+    Turn the META screenshots into sessions of consecutive rows of the same
+    window. A session is profane when any of its rows is. The profane rows
+    are kept, only the other META rows are deleted.
+    """
+    from core.profanity import is_profane
+
+    Screenshot = apps.get_model("core", "Screenshot")
+    WindowSession = apps.get_model("core", "WindowSession")
+
+    rows = (
+        Screenshot.objects.filter(screenshot_type="META")
+        .order_by("timestamp")
+        .values_list("pk", "title", "excutable_name", "timestamp", "is_profane")
+    )
+    sessions = []
+    session = None
+    flagged = []
+    for pk, title, executable_name, timestamp, profane in rows.iterator():
+        # Rows not processed yet are checked here
+        if profane is None:
+            profane = is_profane(title)
+            if profane:
+                flagged.append(pk)
+        if (
+            session is not None
+            and session.title == title
+            and session.executable_name == executable_name
+            and timestamp - session.end <= SESSION_GAP
+        ):
+            session.end = timestamp
+            session.samples += 1
+            session.is_profane = session.is_profane or profane
+            continue
+        session = WindowSession(
+            title=title,
+            executable_name=executable_name,
+            start=timestamp,
+            end=timestamp,
+            samples=1,
+            is_profane=profane,
+        )
+        sessions.append(session)
+
+    WindowSession.objects.bulk_create(sessions, batch_size=BATCH_SIZE)
+    Screenshot.objects.filter(pk__in=flagged).update(is_profane=True)
+    Screenshot.objects.filter(screenshot_type="META").exclude(is_profane=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_screenshot_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WindowSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.TextField()),
+                ('executable_name', models.TextField()),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=1, help_text='Number of uploads during the session')),
+                ('is_profane', models.BooleanField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-end'], name='session_end_idx')],
+            },
+        ),
+        # The sessions can't be turned back into META screenshots
+        migrations.RunPython(collapse_meta_screenshots, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,28 @@
 import logging
+from datetime import timedelta
+from typing import TYPE_CHECKING
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
 import django.dispatch
 
 from .profanity import is_profane
-from .image_utils import decode_base64_to_numpy, get_bounding_boxes # noqa E501
-from .nudity import Detector, Classifier
+from .storage import image_store
+from .timing import StageTimer
+
+# The imaging and ML modules pull in cv2, numpy and onnxruntime. They are
+# imported on first use so management commands that never process a
+# screenshot start fast.
+if TYPE_CHECKING:
+    from .image_utils import ImageContext
 
 logger = logging.getLogger(__name__)
 
 class Screenshot(models.Model):
     title = models.TextField()
     excutable_name = models.TextField()
-    base64_image = models.TextField(null=True, blank=True)
+    image_digest = models.CharField(max_length=64, null=True, blank=True, help_text="SHA-256 digest of the image in the image store")
 
     TYPES = (
         ("META", "META"), # Archive the meta data. No image
@@ -26,89 +36,316 @@ class Screenshot(models.Model):
     is_nsfw = models.BooleanField(null=True, blank=True)
     is_profane = models.BooleanField(null=True, blank=True)
     nsfw_detection = models.JSONField(default=list, blank=True, null=True, help_text="NSFW detection results")
+    timings = models.JSONField(default=dict, blank=True, null=True, help_text="Processing time of every stage in milliseconds")
+    processing_time = models.FloatField(null=True, blank=True, help_text="Total processing time in milliseconds")
     
     timestamp = models.DateTimeField(auto_now_add=True,)
 
+    class Meta:
+        # Every index is ordered by timestamp then id, the order of the admin
+        # list (the admin adds the -pk tie-breaker). Check the plans with
+        # `python -m benchmarks.check_query_plans`.
+        indexes = [
+            models.Index(fields=["-timestamp", "-id"], name="screenshot_ts_idx"),
+            models.Index(fields=["screenshot_type", "-timestamp", "-id"], name="screenshot_type_ts_idx"),
+            # NSFW and profane screenshots are few and the ones that get looked at
+            models.Index(fields=["-timestamp", "-id"], condition=models.Q(is_nsfw=True), name="screenshot_nsfw_ts_idx"),
+            models.Index(fields=["-timestamp", "-id"], condition=models.Q(is_profane=True), name="screenshot_profane_ts_idx"),
+        ]
+
     def __str__(self):
         return self.title
     
+    @property
+    def image_context(self) -> "ImageContext | None":
+        """Decode-once view of the image shared by the processing stages"""
+        from .image_utils import ImageContext
+
+        if not self.image_digest:
+            return None
+        context = getattr(self, "_image_context", None)
+        if context is None or getattr(self, "_image_context_digest", None) != self.image_digest:
+            context = self._image_context = ImageContext(image_store.read(self.image_digest))
+            self._image_context_digest = self.image_digest
+        return context
+
     @property
     def image(self):
-        """Return the base64 string as a OpenCV image"""
-        if self.base64_image:
-            return decode_base64_to_numpy(self.base64_image)
+        """Return the stored image as a OpenCV image"""
+        if self.image_digest:
+            return self.image_context.image
+
+    @property
+    def timer(self) -> StageTimer:
+        """Timings of the processing stages of this screenshot"""
+        timer = getattr(self, "_timer", None)
+        if timer is None:
+            timer = self._timer = StageTimer()
+        return timer
 
     
 
     def run_nsfw_detection(self):
-        if self.base64_image is None:
+        timer = self.timer
+        if self.image_digest is None:
             self.is_nsfw = False
-            self.save()
+            with timer.stage("db"):
+                self.save()
             return
         
         if self.is_nsfw is not None:
             self.is_nsfw = False
-            self.save()
+            with timer.stage("db"):
+                self.save()
             return
 
 
-        image = self.image
-        sub_images = []
-        
-        for x, y, w, h in self.create_bounding_boxes():
-            sub_images.append(image[y:y + h, x:x + w])
-        
-        classifier =  Classifier()
-        for i in sub_images:
-            if classifier.is_nsfw(i):
-                # Run Detector on the images
-                detector = Detector()
-                detector_results = detector.is_nsfw(i)
-                if detector_results['is_nsfw']:
-                    self.is_nsfw = True
-                    self.nsfw_detection = detector_results
-                    break
+        from .cache import result_cache
+        from .nudity import model_version
+
+        context = self.image_context
+        version = model_version()
+
+        # Identical frames reuse the previous result. The key is the exact
+        # digest: a perceptual hash of the whole frame misses small changes,
+        # those are left to the per-crop keys of detect_nsfw.
+        key = ("screenshot", version, self.image_digest)
+        cached = result_cache.get(key)
+        if cached is not None:
+            logger.debug(f"Using the cached NSFW result for {self.title}")
+            self.is_nsfw, self.nsfw_detection = cached
         else:
-            self.is_nsfw = False
-        
-        self.save()
+            with timer.stage("decode"):
+                image = context.image
+            self.is_nsfw, detection = self.detect_nsfw(image, version)
+            if detection is not None:
+                self.nsfw_detection = detection
+            result_cache.set(key, (self.is_nsfw, self.nsfw_detection))
+
+        with timer.stage("db"):
+            self.save()
         logger.info(f"NSFW detection complete for {self.title} - {self.is_nsfw}")
+        logger.debug(f"Image decoded {context.decodes} times for {self.title}")
+        timer.count("decodes", context.decodes)
 
         if not self.is_nsfw:
-            if self.screenshot_type == "NSFW":
-                self.delete()
-            elif self.screenshot_type == "NSFW_META":
-                self.base64_image = None
-                self.save()
+            with timer.stage("db"):
+                if self.screenshot_type == "NSFW":
+                    self.delete()
+                elif self.screenshot_type == "NSFW_META":
+                    digest, self.image_digest = self.image_digest, None
+                    self.save()
+                    image_store.release(digest)
+
+    def detect_nsfw(self, image, version: str) -> tuple[bool, dict | None]:
+        """Find NSFW content in the image, skipping crops already seen"""
+        from openchaver.const import (
+            CASCADE_CLASSIFIER_LOW,
+            CASCADE_CLASSIFIER_HIGH,
+            CASCADE_DETECTOR_AMBIGUOUS,
+        )
+        from .cache import result_cache
+        from .image_utils import perceptual_hash
+        from .nudity import get_classifier, get_detector
+
+        timer = self.timer
+        with timer.stage("regions"):
+            sub_images = []
+            for x, y, w, h in self.create_bounding_boxes():
+                sub_images.append(image[y:y + h, x:x + w])
+        timer.count("crops", len(sub_images))
+        with timer.stage("hash"):
+            keys = [(version, i.shape, perceptual_hash(i)) for i in sub_images]
+
+        # Score every uncached crop in as few forward passes as possible
+        scores = [result_cache.get(("score", *k)) for k in keys]
+        missing = [n for n, score in enumerate(scores) if score is None]
+        if missing:
+            with timer.stage("classify"):
+                new_scores = get_classifier().scores([sub_images[n] for n in missing])
+            for n, score in zip(missing, new_scores):
+                scores[n] = score
+                result_cache.set(("score", *keys[n]), score)
+
+        # Confident classifier scores decide on their own
+        detections = {}
+        for n, score in enumerate(scores):
+            if score <= CASCADE_CLASSIFIER_LOW:
+                logger.debug(f"Crop {n}: classifier score {score:.2f} - safe, detector skipped")
+                continue
+            if score >= CASCADE_CLASSIFIER_HIGH:
+                logger.debug(f"Crop {n}: classifier score {score:.2f} - NSFW, detector skipped")
+                detections[n] = {"detections": [], "is_nsfw": True, "classifier_score": score}
+            else:
+                detections[n] = result_cache.get(("detection", *keys[n]))
+                if detections[n] is not None:
+                    logger.debug(f"Crop {n}: classifier score {score:.2f} - cached detector NSFW - {detections[n]['is_nsfw']}")
+
+        # Borderline crops run the fast detector in one batch
+        borderline = [n for n, detection in detections.items() if detection is None]
+        if borderline:
+            logger.debug(f"Crops {borderline}: borderline classifier scores - fast detector")
+            with timer.stage("detect"):
+                results = get_detector().detect([sub_images[n] for n in borderline], fast=True)
+            ambiguous = []
+            for n, detection in zip(borderline, results):
+                detections[n] = detection
+                low, high = CASCADE_DETECTOR_AMBIGUOUS
+                if not detection["is_nsfw"] and low <= detection["nsfw_score"] <= high:
+                    ambiguous.append(n)
+
+            # Ambiguous fast results are checked again at full resolution
+            if ambiguous:
+                logger.debug(f"Crops {ambiguous}: ambiguous fast detection - full resolution detector")
+                with timer.stage("detect"):
+                    results = get_detector().detect([sub_images[n] for n in ambiguous], fast=False)
+                for n, detection in zip(ambiguous, results):
+                    detections[n] = detection
+
+            for n in borderline:
+                logger.debug(f"Crop {n}: detector NSFW - {detections[n]['is_nsfw']}")
+                result_cache.set(("detection", *keys[n]), detections[n])
+
+        for n in sorted(detections):
+            if detections[n]['is_nsfw']:
+                return True, detections[n]
+        return False, None
 
     def run_profanity_detection(self):  
         if self.is_profane is None:
-            self.is_profane = is_profane(self.title)
-            self.save()
+            with self.timer.stage("profanity"):
+                self.is_profane = is_profane(self.title)
+            with self.timer.stage("db"):
+                self.save()
+
+    def process(self):
+        """Run the profanity and NSFW checks on the screenshot"""
+        self.run_profanity_detection()
+        if self.is_nsfw is None:
+            self.run_nsfw_detection()
+
+        # Check if the instance has been deleted
+        if self.pk is None:
+            return
+
+        # Store the timings without rewriting the whole row
+        self.timings = self.timer.as_dict()
+        self.processing_time = round(self.timer.total, 2)
+        Screenshot.objects.filter(pk=self.pk).update(
+            timings=self.timings, processing_time=self.processing_time
+        )
 
     def create_bounding_boxes(self) -> list:
         """Create bounding boxes for the images in the screenshot"""
-        if self.base64_image is None:
+        if self.image_digest is None:
             return []
-        return get_bounding_boxes(self.image)
+        return self.image_context.bounding_boxes()
+
+
+class WindowSession(models.Model):
+    """A contiguous span of time a window was in focus, built from the uploads of the monitor"""
+
+    title = models.TextField()
+    executable_name = models.TextField()
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    samples = models.PositiveIntegerField(default=1, help_text="Number of uploads during the session")
+    is_profane = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # record_sample extends the latest session
+            models.Index(fields=["-end"], name="session_end_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def duration(self) -> timedelta:
+        return self.end - self.start
+
+    @classmethod
+    def record_sample(cls, title: str, executable_name: str, timestamp=None):
+        """
+        Extend the latest session to timestamp if it is the same window and
+        it ended less than SESSION_GAP seconds ago, otherwise start a new one.
+        A session has a single title, so its title is checked for profanity
+        once, when it starts.
+        """
+        from openchaver.const import SESSION_GAP
+
+        timestamp = timestamp or timezone.now()
+        latest = cls.objects.order_by("-end").values("pk")[:1]
+        with transaction.atomic():
+            # A single UPDATE for the common case of a window staying in focus
+            extended = cls.objects.filter(
+                pk=Subquery(latest),
+                title=title,
+                executable_name=executable_name,
+                end__gte=timestamp - timedelta(seconds=SESSION_GAP),
+            ).update(end=timestamp, samples=F("samples") + 1)
+            if not extended:
+                cls.objects.create(
+                    title=title,
+                    executable_name=executable_name,
+                    start=timestamp,
+                    end=timestamp,
+                    is_profane=is_profane(title),
+                )
+
+
+class StoredImage(models.Model):
+    """An image file of the image store and the number of rows referencing it"""
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveIntegerField(help_text="Size of the file in bytes")
+    refcount = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.digest} ({self.refcount})"
+
+
+class ProcessingJob(models.Model):
+    """A screenshot waiting to be processed by the worker pool"""
+
+    STATUSES = (
+        ("PENDING", "PENDING"), # Waiting for a worker
+        ("RUNNING", "RUNNING"), # Claimed by a worker
+        ("FAILED", "FAILED"), # Gave up after too many attempts
+    )
+
+    screenshot = models.OneToOneField(Screenshot, on_delete=models.CASCADE, related_name="job")
+    status = models.TextField(choices=STATUSES, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # claim_job takes the oldest pending jobs
+            models.Index(fields=["status", "id"], name="job_status_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.screenshot_id} - {self.status}"
 
 
 @django.dispatch.receiver(models.signals.post_save, sender=Screenshot)
-def post_process(sender, instance: Screenshot, **kwargs):
-    instance.run_profanity_detection()
-    if instance.is_nsfw is None:
-        instance.run_nsfw_detection()
-    
-    # Check if the instanve has been deleted
-    if Screenshot.objects.filter(pk=instance.pk).exists():
+def post_process(sender, instance: Screenshot, created=False, **kwargs):
+    """Queue new screenshots for processing by the worker pool"""
+    if not created:
         return
-    
-    # If the image is not NSFW and the latest screenshot has the same title
-    # then delete the this one
-    if not instance.is_nsfw:
-        latest_screenshot = Screenshot.objects.exclude(pk=instance.pk).order_by('-timestamp').first()
-        if latest_screenshot and latest_screenshot.title == instance.title:
-            instance.delete()
-            return
+
+    from .worker import notify_workers
+
+    ProcessingJob.objects.create(screenshot=instance)
+    transaction.on_commit(notify_workers)
 
 
+@django.dispatch.receiver(models.signals.post_delete, sender=Screenshot)
+def release_image(sender, instance: Screenshot, **kwargs):
+    """Drop the reference of a deleted screenshot to its image"""
+    transaction.on_commit(lambda: image_store.release(instance.image_digest))
@@ -1,16 +1,28 @@
 import logging
+import os
+import tempfile
+import threading
 from pathlib import Path
 
 import numpy as np
-from PIL import Image
 import cv2 as cv
 
 from openchaver.dirs import get_data_dir
-from .image_utils import match_size, resize_image
+from openchaver.const import (
+    ONNX_INTRA_OP_THREADS,
+    ONNX_INTER_OP_THREADS,
+    ONNX_EXECUTION_MODE,
+    ONNX_GRAPH_OPTIMIZATION,
+    CLASSIFICATION_MODEL_PRECISION,
+    DETECTION_MODEL_PRECISION,
+    CASCADE_CLASSIFIER_LOW,
+    CASCADE_CLASSIFIER_HIGH,
+    CASCADE_DETECTOR_AMBIGUOUS,
+)
+from .image_utils import ScratchBuffers, aspect_ratio_buckets, bucket_size
 
 
 model_dir = get_data_dir() / "models"
-model_dir.mkdir(parents=True, exist_ok=True)
 
 DETECTION_MODEL_URL = 'https://pub-43a5d92b0b0b4908a9aec2a745986a23.r2.dev/detector_v2_default_checkpoint.onnx'  # noqa: E501
 DETECTION_MODEL_SHA256_HASH = "D4BE1C504BE61851D9745E6DA8FA09455EB39B8856626DD6B5CA413C9E8B1578"  # noqa: E501
@@ -20,19 +32,143 @@ CLASSIFICATION_MODEL_URL = 'https://pub-43a5d92b0b0b4908a9aec2a745986a23.r2.dev/
 CLASSIFICATION_MODEL_SHA256_HASH = "864BB37BF8863564B87EB330AB8C785A79A773F4E7C43CB96DB52ED8611305FA"  # noqa: E501
 CLASSIFICATION_MODEL_PATH = model_dir / 'classify.onnx'
 
+DETECTION_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
 logger = logging.getLogger(__name__)
 
+# Thread counts of the ONNX Runtime sessions, see limit_threads
+intra_op_threads = ONNX_INTRA_OP_THREADS
+inter_op_threads = ONNX_INTER_OP_THREADS
+
+def limit_threads(threads: int):
+    """
+    Run inference on at most threads threads, for processes sharing the
+    CPU. Thread counts set in the settings are kept.
+    """
+    global intra_op_threads, inter_op_threads
+    if ONNX_INTRA_OP_THREADS == 0:
+        intra_op_threads = threads
+    if ONNX_INTER_OP_THREADS == 0:
+        inter_op_threads = threads
+    cv.setNumThreads(threads)
+
+def optimized_model_path(model_path: Path) -> Path:
+    """Path of the optimized copy of a model for the current settings"""
+    import onnxruntime
+    return model_path.with_name(
+        f"{model_path.stem}.opt-{ONNX_GRAPH_OPTIMIZATION}-{onnxruntime.__version__}.onnx"  # noqa: E501
+    )
+
+def create_session(model_path: Path, optimize=True):
+    """
+    Create an ONNX Runtime session with the configured session options.
+    The optimized graph is saved next to the model on the first load,
+    later loads use it and skip the graph optimization.
+    """
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = {
+        "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+    }[ONNX_EXECUTION_MODE]
+    level = {
+        "disabled": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[ONNX_GRAPH_OPTIMIZATION]
+    providers = ["CPUExecutionProvider"]
+
+    if not optimize or ONNX_GRAPH_OPTIMIZATION == "disabled":
+        options.graph_optimization_level = level
+        return onnxruntime.InferenceSession(str(model_path), options,
+                                            providers=providers)
+
+    optimized_path = optimized_model_path(model_path)
+    if (optimized_path.exists()
+            and optimized_path.stat().st_mtime >= model_path.stat().st_mtime):
+        options.graph_optimization_level = \
+            onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return onnxruntime.InferenceSession(str(optimized_path), options,
+                                                providers=providers)
+        except:  # noqa E722
+            # Not deleted, another process may have it open. The rebuilt
+            # copy replaces it.
+            logger.exception(f"Failed to load {optimized_path}, rebuilding it")
+
+    logger.info(f"Optimizing {model_path.name}")
+    options.graph_optimization_level = level
+    # Worker processes can start at the same time, each one saves the
+    # optimized graph to its own file and moves it into place once complete
+    fd, tmp_path = tempfile.mkstemp(dir=optimized_path.parent,
+                                    prefix=f"{optimized_path.stem}.",
+                                    suffix=".tmp")
+    os.close(fd)
+    options.optimized_model_filepath = tmp_path
+    try:
+        session = onnxruntime.InferenceSession(str(model_path), options,
+                                               providers=providers)
+        os.replace(tmp_path, optimized_path)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+    return session
+
 def test_model(model_path: Path) -> bool:
     """Test if a model can be loaded"""
-    import onnxruntime
     try:
-        onnxruntime.InferenceSession(str(model_path),
-                                     providers=["CPUExecutionProvider"])
+        create_session(model_path, optimize=False)
         return True
     except:  # noqa E722
         logger.error("Failed to load model")
         return False
 
+def quantized_model_path(model_path: Path) -> Path:
+    """Path of the INT8 copy of a model"""
+    return model_path.with_name(f"{model_path.stem}.int8.onnx")
+
+def quantize_model(model_path: Path, rebuild=False) -> Path:
+    """
+    Create the INT8 copy of a model with dynamic quantization
+    and return its path. The copy is only created once, unless rebuild.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    int8_path = quantized_model_path(model_path)
+    if (not rebuild and int8_path.exists()
+            and int8_path.stat().st_mtime >= model_path.stat().st_mtime):
+        return int8_path
+
+    logger.info(f"Quantizing {model_path.name} to INT8")
+    # Worker processes can quantize at the same time, each one writes its
+    # own file and moves it into place once complete
+    fd, tmp_path = tempfile.mkstemp(dir=int8_path.parent,
+                                    prefix=f"{int8_path.stem}.",
+                                    suffix=".tmp")
+    os.close(fd)
+    try:
+        quantize_dynamic(str(model_path), tmp_path,
+                         weight_type=QuantType.QUInt8)
+        os.replace(tmp_path, int8_path)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+    return int8_path
+
+def create_quantized_session(model_path: Path):
+    """
+    Create a session of the INT8 copy of a model. A copy that fails to load
+    is quantized again.
+    """
+    int8_path = quantize_model(model_path)
+    try:
+        return create_session(int8_path)
+    except:  # noqa E722
+        logger.exception(f"Failed to load {int8_path}, rebuilding it")
+        return create_session(quantize_model(model_path, rebuild=True))
+
 def chech_hash(path: Path, hash: str) -> bool:
     """Check the hash of a file"""
     import hashlib
@@ -49,6 +185,7 @@ def download_model(url, path: Path, hash=None):
     import requests
 
     logger.info("Downloading model...")
+    path.parent.mkdir(parents=True, exist_ok=True)
     try:
         # Download
         response = requests.get(url, stream=True, verify=False)
@@ -72,10 +209,12 @@ def download_model(url, path: Path, hash=None):
 
 class Detector:
 
-    def __init__(self):
-        import onnxruntime
-        model_file = DETECTION_MODEL_PATH
-        logger.debug(f"Loading detection model from {model_file}")
+    def __init__(self, precision="fp32", model_file: Path | None = None):
+        # A custom model_file is used as is, the default one is downloaded
+        if model_file is None:
+            model_file = DETECTION_MODEL_PATH
+        elif not model_file.exists():
+            raise FileNotFoundError(model_file)
 
         if not model_file.exists():
             logger.debug(
@@ -83,8 +222,13 @@ class Detector:
             download_model(DETECTION_MODEL_URL, model_file,
                            DETECTION_MODEL_SHA256_HASH)
 
-        self.detection_model = onnxruntime.InferenceSession(
-            str(model_file), providers=["CPUExecutionProvider"])
+        logger.debug(f"Loading detection model from {model_file}")
+        self.precision = precision
+        if precision == "int8":
+            self.detection_model = create_quantized_session(model_file)
+        else:
+            self.detection_model = create_session(model_file)
+        self._buffers = ScratchBuffers()
 
         self.classes = [
             "EXPOSED_ANUS",
@@ -104,6 +248,21 @@ class Detector:
             "EXPOSED_BREAST_M",
             "EXPOSED_GENITALIA_M",
         ]
+        self.nsfw_labels = [
+            "EXPOSED_ANUS",
+            "EXPOSED_BUTTOCKS",
+            "EXPOSED_BREAST_F",
+            "EXPOSED_GENITALIA_F",
+            "EXPOSED_GENITALIA_M",
+        ]
+        self.nsfw_label_mask = np.isin(self.classes, self.nsfw_labels)
+
+        # Resolved once instead of on every batch
+        self.input_name = self.detection_model.get_inputs()[0].name
+        self.output_names = [
+            o.name for o in self.detection_model.get_outputs()
+        ]
+        self.output_roles = self._resolve_outputs()
 
     def detect(
         self,
@@ -112,103 +271,115 @@ class Detector:
         fast=True,
         batch_size=5,
     ) -> list[dict]:
-        """Detect objects in an image."""
-
-        # Function to preprocess the image
-        def preprocess_image(
-            image_path,
-            min_side,
-            max_side,
-        ):
-            image = np.ascontiguousarray(
-                Image.fromarray(image_path))[:, :, ::-1]
-            image = image.astype(np.float32)
-            image -= [103.939, 116.779, 123.68]
-            image, scale = resize_image(image,
-                                        min_side=min_side,
-                                        max_side=max_side)
-            return image, scale
-
-        # Match size
-        images = match_size(images)
-
-        # Preprocess images
-        preprocessed_images = [
-            preprocess_image(img,
-                             min_side=480 if fast else 800,
-                             max_side=800 if fast else 1333) for img in images
-        ]
-        # Show images
-
-        min_prob = 0.5 if fast else 0.6
-        scale = preprocessed_images[0][1]
-        preprocessed_images = [p[0] for p in preprocessed_images]
-        results = []
+        """Detect objects in an image.
+
+        Images with a similar aspect ratio are resized to a shared input
+        size and run together, instead of padding every image to the
+        largest one. Results are returned in the order of images.
+        """
+
+        min_side, max_side = (480, 800) if fast else (800, 1333)
+        if min_prob is None:
+            min_prob = 0.5 if fast else 0.6
+        results = [None] * len(images)
+
+        for key, indices in aspect_ratio_buckets(images).items():
+            size = bucket_size(key, min_side=min_side, max_side=max_side)
+            for start in range(0, len(indices), batch_size):
+                batch_indices = indices[start:start + batch_size]
+                batch = self.preprocess([images[i] for i in batch_indices],
+                                        size, batch_size)
+                # Per image (x, y, x, y) scale from the input to the model size
+                scales = np.array([[
+                    size[1] / images[i].shape[1],
+                    size[0] / images[i].shape[0],
+                ] * 2 for i in batch_indices], dtype=np.float32)
+
+                outputs = self.detection_model.run(
+                    self.output_names, {self.input_name: batch})
+                batch_results = self._postprocess(outputs, scales, min_prob)
+                for i, frame_result in zip(batch_indices, batch_results):
+                    results[i] = frame_result
 
-        while len(preprocessed_images):
-            batch = preprocessed_images[:batch_size]
-            preprocessed_images = preprocessed_images[batch_size:]
-            outputs = self.detection_model.run(
-                [s_i.name for s_i in self.detection_model.get_outputs()],
-                {self.detection_model.get_inputs()[0].name: np.asarray(batch)},
-            )
+        return results
 
-            labels = [op for op in outputs if op.dtype == "int32"][0]
-            scores = [
-                op for op in outputs if isinstance(op[0][0], np.float32)
-            ][0]  # type: ignore
-            boxes = [op for op in outputs
-                     if isinstance(op[0][0], np.ndarray)][0]
-            boxes /= scale
-
-            for frame_boxes, frame_scores, frame_labels in zip(
-                    boxes,
-                    scores,
-                    labels,
-            ):
-                frame_result = {"detections": [], 'is_nsfw': False}
-                for box, score, label in zip(frame_boxes, frame_scores,
-                                             frame_labels):
-                    if score < min_prob:
-                        continue
-                    box = box.astype(int).tolist()
-                    label = self.classes[label]
-                    detection = {
-                        "box": [int(c) for c in box],
-                        "score": float(score),
-                        "label": label,
-                    }
-                    frame_result["detections"].append(detection)
-
-                is_nsfw = self._eval_detection(frame_result["detections"])
-                frame_result["is_nsfw"] = is_nsfw
-                results.append(frame_result)
+    def preprocess(self, images: list[np.ndarray], size,
+                   batch_size=None) -> np.ndarray:
+        """
+        Resize the images to size (height, width) in uint8 and normalize
+        them into a reused float32 batch buffer of batch_size images.
+        """
+        capacity = max(len(images), batch_size or 0)
+        batch = self._buffers.get("batch", (capacity, size[0], size[1], 3),
+                                  dtype=np.float32)[:len(images)]
+        for image, buffer in zip(images, batch):
+            image = cv.resize(image, (size[1], size[0]))
+            # Reverse the channels and subtract the mean in a single pass
+            np.subtract(image[:, :, ::-1], DETECTION_MEAN, out=buffer)
+        return batch
+
+    def _resolve_outputs(self) -> dict:
+        """Find which model output holds the labels, scores and boxes"""
+        roles = {}
+        for index, output in enumerate(self.detection_model.get_outputs()):
+            if output.type == "tensor(int32)":
+                roles["labels"] = index
+            elif len(output.shape) == 3:
+                roles["boxes"] = index
+            else:
+                roles["scores"] = index
+        return roles
+
+    def _postprocess(self, outputs, scales, min_prob,
+                     threshold=0.6) -> list[dict]:
+        """Convert the raw model outputs of a batch into detections"""
+        labels = outputs[self.output_roles["labels"]]
+        scores = outputs[self.output_roles["scores"]]
+        boxes = outputs[self.output_roles["boxes"]] / scales[:, None, :]
+
+        keep = scores >= min_prob
+        # A frame is NSFW if it has an NSFW label above the threshold
+        nsfw = keep & self.nsfw_label_mask[labels] & (scores > threshold)
+        frames_nsfw = nsfw.any(axis=1).tolist()
+        # Best NSFW label score of every frame, even below min_prob
+        nsfw_scores = np.where(self.nsfw_label_mask[labels], scores,
+                               0).max(axis=1).tolist()
+        boxes = boxes.astype(int)
 
+        results = []
+        for frame, (is_nsfw, nsfw_score) in enumerate(
+                zip(frames_nsfw, nsfw_scores)):
+            index = np.flatnonzero(keep[frame])
+            detections = [
+                {
+                    "box": box,
+                    "score": score,
+                    "label": self.classes[label],
+                } for box, score, label in zip(
+                    boxes[frame, index].tolist(),
+                    scores[frame, index].tolist(),
+                    labels[frame, index].tolist(),
+                )
+            ]
+            results.append({
+                "detections": detections,
+                "is_nsfw": is_nsfw,
+                "nsfw_score": max(nsfw_score, 0.0),
+            })
         return results
 
-    def _eval_detection(self, result, threshold=0.6) -> bool:
-        nsfw_labels = [
-            "EXPOSED_ANUS",
-            "EXPOSED_BUTTOCKS",
-            "EXPOSED_BREAST_F",
-            "EXPOSED_GENITALIA_F",
-            "EXPOSED_GENITALIA_M",
-        ]
-        for detection in result:
-            if detection[
-                    "label"] in nsfw_labels and detection["score"] > threshold:
-                return True
-        return False
-
     def is_nsfw(self, img: np.ndarray) -> dict:
         """Detect objects in an image."""
         return self.detect([img])[0]
 
 class Classifier:
 
-    def __init__(self):
-        model_file = CLASSIFICATION_MODEL_PATH
-        logger.info(f"Loading classification model from {model_file}")
+    def __init__(self, precision="fp32", model_file: Path | None = None):
+        # A custom model_file is used as is, the default one is downloaded
+        if model_file is None:
+            model_file = CLASSIFICATION_MODEL_PATH
+        elif not model_file.exists():
+            raise FileNotFoundError(model_file)
 
         if not model_file.exists():
             logger.info(
@@ -217,33 +388,149 @@ class Classifier:
             download_model(CLASSIFICATION_MODEL_URL, model_file,
                            CLASSIFICATION_MODEL_SHA256_HASH)
 
-        self.lite_model = cv.dnn.readNet(str(model_file))
-
-    def classify(self, images: list[np.ndarray], threshold=0.6):
-        """Classify an image."""
+        logger.info(f"Loading classification model from {model_file}")
+        self.precision = precision
+        if precision == "int8":
+            # cv.dnn can't run the integer operators of a dynamically
+            # quantized model, so the INT8 model runs on ONNX Runtime
+            self.lite_model = None
+            self.session = create_quantized_session(model_file)
+        else:
+            self.lite_model = cv.dnn.readNet(str(model_file))
+            self.session = None
+
+        # cv.dnn.Net keeps its input and intermediate blobs on the instance,
+        # so a shared classifier must not run two forward passes at once
+        self._lock = threading.Lock()
+        self._batched = True
+
+    def preprocess(self, images: list[np.ndarray]) -> np.ndarray:
+        """Stack the images into a single NHWC float32 blob."""
 
-        # Preprocess images
         # Copied from
         # https://pypi.org/project/opennsfw-standalone/
-        preprocessed_images = []
-        for image in images:
-
+        blob = np.empty((len(images), 224, 224, 3), dtype=np.float32)
+        mean = np.array([104, 117, 123], dtype=np.float32)
+        for i, image in enumerate(images):
             image = cv.resize(image, (224, 224), interpolation=cv.INTER_LINEAR)
+            np.subtract(image, mean, out=blob[i])
+        return blob
+
+    def _forward(self, blob: np.ndarray) -> np.ndarray:
+        """Run the model on a preprocessed blob."""
+        if self.session is not None:
+            return self.session.run(
+                None, {self.session.get_inputs()[0].name: blob})[0]
+        with self._lock:
+            self.lite_model.setInput(blob)
+            return self.lite_model.forward()
+
+    def scores(self, images: list[np.ndarray], batch_size=8) -> list[float]:
+        """Return the NSFW score of every image.
+
+        The images are sent through the network in batches of at most
+        batch_size crops, one forward pass per batch.
+        """
+        scores = []
+        for start in range(0, len(images), batch_size):
+            blob = self.preprocess(images[start:start + batch_size])
+            result = None
+            if self._batched or len(blob) == 1:
+                try:
+                    result = self._forward(blob)
+                except Exception:
+                    if len(blob) == 1:
+                        raise
+                    # The model was exported with a fixed batch dimension
+                    logger.warning(
+                        "Classification model does not support batching")
+                    self._batched = False
+
+            if result is None:
+                result = np.concatenate(
+                    [self._forward(blob[i:i + 1]) for i in range(len(blob))])
+
+            scores.extend(float(r[1]) for r in result)
+        return scores
 
-            image_jpeg_data = image.astype(np.float32, copy=False)
-
-            image_jpeg_data -= np.array([104, 117, 123], dtype=np.float32)
-
-            image_jpeg_data = np.expand_dims(image_jpeg_data, axis=0)
-
-            preprocessed_images.append(image_jpeg_data)
-
-        # Run model
-        for image in preprocessed_images:
-            self.lite_model.setInput(image)
-            result = self.lite_model.forward()
-            yield result[0][1] > threshold
+    def classify(self, images: list[np.ndarray], threshold=0.6):
+        """Classify an image."""
+        for score in self.scores(images):
+            yield score > threshold
 
     def is_nsfw(self, image: np.ndarray, threshold=0.6) -> bool:
         """Classify an image."""
-        return next(self.classify([image], threshold))
\ No newline at end of file
+        return next(self.classify([image], threshold))
+
+def model_version() -> str:
+    """Identify the models and settings producing the NSFW results"""
+    return "-".join([
+        CLASSIFICATION_MODEL_SHA256_HASH[:12],
+        CLASSIFICATION_MODEL_PRECISION,
+        DETECTION_MODEL_SHA256_HASH[:12],
+        DETECTION_MODEL_PRECISION,
+        # The cascade decides which detector results are produced
+        str(CASCADE_CLASSIFIER_LOW),
+        str(CASCADE_CLASSIFIER_HIGH),
+        str(CASCADE_DETECTOR_AMBIGUOUS),
+    ])
+
+class ModelRegistry:
+    """Process-wide cache of loaded models
+
+    Loading a model reads the ONNX file from disk and builds the inference
+    session, so every model is created once per process and shared by all
+    callers. ``InferenceSession.run`` is thread-safe and the classifier
+    serializes its own forward passes.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """Return the model stored under key, creating it on first use"""
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = factory()
+                    self._models[key] = model
+        return model
+
+    def register(self, key, model):
+        """Store an already loaded model under key"""
+        with self._lock:
+            self._models[key] = model
+
+    def clear(self):
+        """Drop every loaded model"""
+        with self._lock:
+            self._models.clear()
+
+
+registry = ModelRegistry()
+
+
+def get_classifier(precision=None) -> Classifier:
+    """Return the shared classifier"""
+    precision = precision or CLASSIFICATION_MODEL_PRECISION
+    return registry.get(("classifier", precision),
+                        lambda: Classifier(precision))
+
+
+def get_detector(precision=None) -> Detector:
+    """Return the shared detector"""
+    precision = precision or DETECTION_MODEL_PRECISION
+    return registry.get(("detector", precision),
+                        lambda: Detector(precision))
+
+
+def warm_up_models():
+    """Load the models and run one inference so the first job is not slow"""
+    logger.info("Warming up the NSFW models")
+    image = np.zeros((224, 224, 3), dtype=np.uint8)
+    get_classifier().is_nsfw(image)
+    get_detector().is_nsfw(image)
+    logger.info("NSFW models are ready")
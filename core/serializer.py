@@ -1,8 +1,39 @@
+import base64
+import binascii
+
 from rest_framework import serializers
 
+from .codec import sniff_mime_type
 from .models import Screenshot
+from .storage import image_store
 
 class ScreenshotSerializer(serializers.ModelSerializer):
+    # Uploads still send the image as base64. It goes to the image store
+    # and only its digest is kept on the row.
+    base64_image = serializers.CharField(write_only=True, required=False, allow_null=True, allow_blank=True)
+
     class Meta:
         model = Screenshot
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        read_only_fields = ('image_digest',)
+
+    def validate_base64_image(self, value):
+        if not value:
+            return None
+        try:
+            data = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError):
+            raise serializers.ValidationError("Invalid base64 image")
+        if sniff_mime_type(data) is None:
+            raise serializers.ValidationError("The image is not a PNG, JPEG or WebP image")
+        return data
+
+    def create(self, validated_data):
+        data = validated_data.pop('base64_image', None)
+        if data:
+            validated_data['image_digest'] = image_store.put(data)
+        try:
+            return super().create(validated_data)
+        except Exception:
+            image_store.release(validated_data.get('image_digest'))
+            raise
@@ -0,0 +1,139 @@
+"""
+Content-addressed store of the screenshot images.
+
+Images are files named by the SHA-256 digest of their encoded bytes, in
+sharded directories under the data dir (ab/cd/abcd...). Rows only keep
+the digest. Identical images are stored once and the StoredImage table
+counts the rows referencing each file, which is removed with the last
+reference.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from functools import cached_property
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import F
+
+from openchaver.dirs import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+
+class ImageStore:
+    def __init__(self, root: Path | None = None):
+        if root is not None:
+            self.root = Path(root)
+
+    @cached_property
+    def root(self) -> Path:
+        return get_data_dir("images")
+
+    def path(self, digest: str) -> Path:
+        """Path of the file of digest"""
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def read(self, digest: str) -> bytes:
+        """Encoded bytes of the image of digest"""
+        return self.path(digest).read_bytes()
+
+    def write_file(self, data: bytes) -> str:
+        """
+        Write data to the store if it isn't there yet and return its digest.
+        Doesn't take a reference, see put.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if path.exists():
+            return digest
+
+        tmp, digest, _ = self._write_temp([data])
+        self._link(tmp, digest)
+        return digest
+
+    def _write_temp(self, chunks) -> tuple[Path, str, int]:
+        """Write chunks to a temporary file of the store, hashing them on the way"""
+        # The temporary file is on the same file system as the final path
+        # so it is renamed into place and a reader never sees a partial image
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return Path(tmp), sha.hexdigest(), size
+
+    def _link(self, tmp: Path, digest: str):
+        """Move a temporary file to the path of digest, or drop it if already stored"""
+        path = self.path(digest)
+        try:
+            if path.exists():
+                tmp.unlink()
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def put(self, data: bytes) -> str:
+        """Store data, take a reference to it and return its digest"""
+        from .models import StoredImage
+
+        digest = self.write_file(data)
+        # The update holds the database write lock until the commit, so a
+        # concurrent release of the last reference can't remove the file
+        # between the write and the new reference
+        with transaction.atomic():
+            updated = StoredImage.objects.filter(digest=digest).update(refcount=F("refcount") + 1)
+            if not updated:
+                StoredImage.objects.create(digest=digest, size=len(data), refcount=1)
+            if not self.exists(digest):
+                self.write_file(data)
+        return digest
+
+    def put_stream(self, chunks) -> str:
+        """
+        Store the bytes of an iterable of chunks, take a reference to them and
+        return their digest. The data is never held in memory as a whole.
+        """
+        from .models import StoredImage
+
+        tmp, digest, size = self._write_temp(chunks)
+        try:
+            with transaction.atomic():
+                updated = StoredImage.objects.filter(digest=digest).update(refcount=F("refcount") + 1)
+                if not updated:
+                    StoredImage.objects.create(digest=digest, size=size, refcount=1)
+                self._link(tmp, digest)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return digest
+
+    def release(self, digest: str | None):
+        """Drop a reference to digest and remove the file with the last one"""
+        from .models import StoredImage
+
+        if not digest:
+            return
+        with transaction.atomic():
+            StoredImage.objects.filter(digest=digest).update(refcount=F("refcount") - 1)
+            deleted, _ = StoredImage.objects.filter(digest=digest, refcount__lte=0).delete()
+            if deleted:
+                self.path(digest).unlink(missing_ok=True)
+                logger.debug(f"Removed image {digest}")
+
+
+image_store = ImageStore()
@@ -0,0 +1,35 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Accumulate the wall time of the processing stages of a screenshot"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the with block to the stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stages[name] = self.stages.get(name, 0) + elapsed
+
+    def count(self, name: str, value: int):
+        """Record a counter next to the timings"""
+        self.counters[name] = value
+
+    @property
+    def total(self) -> float:
+        """Total time of every stage in milliseconds"""
+        return sum(self.stages.values())
+
+    def as_dict(self) -> dict:
+        """Stage timings in milliseconds and counters, ready to be stored"""
+        timings = {name: round(ms, 2) for name, ms in self.stages.items()}
+        timings.update(self.counters)
+        return timings
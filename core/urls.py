@@ -1,9 +1,13 @@
 from django.urls import path
 
 from rest_framework import routers
-from .views import ScreenshotViewSet
+from .views import ScreenshotUploadView, ScreenshotViewSet, metrics
 
 router = routers.DefaultRouter()
 router.register(r'screenshots', ScreenshotViewSet)
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('metrics/', metrics, name='metrics'),
+    # Before the router, which would take "upload" for a screenshot id
+    path('screenshots/upload/', ScreenshotUploadView.as_view(), name='screenshot-upload'),
+] + router.urls
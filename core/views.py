@@ -1,10 +1,127 @@
+import itertools
+from urllib.parse import unquote
+
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, UnsupportedMediaType
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from .models import Screenshot
+from .codec import sniff_mime_type
+from .metrics import INGEST_REQUESTS, INGEST_SECONDS, registry
+from .models import Screenshot, WindowSession
 from .serializer import ScreenshotSerializer
+from .storage import image_store
+
+# Raw uploads send the fields as percent-encoded headers
+UPLOAD_HEADERS = {
+    "title": "X-Title",
+    "excutable_name": "X-Executable-Name",
+    "screenshot_type": "X-Screenshot-Type",
+}
+
+# Size of the chunks streamed from the request body to the image store
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+def save_upload(serializer: ScreenshotSerializer, **kwargs) -> Response:
+    """
+    Record the window of a validated upload in its session and save the
+    screenshot. META uploads only record the window, no screenshot is
+    created so they get 204 No Content.
+    """
+    data = serializer.validated_data
+    WindowSession.record_sample(data["title"], data["excutable_name"])
+    if data.get("screenshot_type", "META") == "META":
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    serializer.save(**kwargs)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class ScreenshotViewSet(ModelViewSet):
     queryset = Screenshot.objects.all()
     serializer_class = ScreenshotSerializer
 
+    def create(self, request, *args, **kwargs):
+        with INGEST_SECONDS.time():
+            try:
+                serializer = self.get_serializer(data=request.data)
+                serializer.is_valid(raise_exception=True)
+                response = save_upload(serializer)
+            except APIException as e:
+                INGEST_REQUESTS.inc(type=request.data.get("screenshot_type", "META"), status=e.status_code)
+                raise
+        INGEST_REQUESTS.inc(
+            type=request.data.get("screenshot_type", "META"),
+            status=response.status_code,
+        )
+        return response
+
+
+class ScreenshotUploadView(APIView):
+    """
+    Upload a screenshot as the encoded image bytes, without base64.
+
+    Either a raw body with an image/* Content-Type and the fields in the
+    X-Title, X-Executable-Name and X-Screenshot-Type headers, or a
+    multipart form with an "image" file and the fields. The image is
+    streamed to the image store as it is read. META uploads get 204 No
+    Content, as no screenshot is created.
+    """
+
+    parser_classes = (MultiPartParser,)
+    serializer_class = ScreenshotSerializer
+
+    def post(self, request):
+        multipart = request.content_type.startswith("multipart/")
+        if multipart:
+            fields = {name: request.data[name] for name in UPLOAD_HEADERS if name in request.data}
+        else:
+            fields = {
+                name: unquote(request.headers[header])
+                for name, header in UPLOAD_HEADERS.items()
+                if header in request.headers
+            }
+
+        with INGEST_SECONDS.time():
+            try:
+                response = self.upload(request, fields, multipart)
+            except APIException as e:
+                INGEST_REQUESTS.inc(type=fields.get("screenshot_type", "META"), status=e.status_code)
+                raise
+        INGEST_REQUESTS.inc(type=fields.get("screenshot_type", "META"), status=response.status_code)
+        return response
+
+    def upload(self, request, fields: dict, multipart: bool) -> Response:
+        # Check the fields before anything is written to the store
+        serializer = ScreenshotSerializer(data=fields)
+        serializer.is_valid(raise_exception=True)
+
+        if serializer.validated_data.get("screenshot_type", "META") == "META":
+            chunks = None
+        elif multipart:
+            image = request.FILES.get("image")
+            chunks = image.chunks(UPLOAD_CHUNK_SIZE) if image else None
+        elif request.stream is None:
+            chunks = None
+        elif request.content_type.startswith("image/"):
+            chunks = iter(lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b"")
+        else:
+            raise UnsupportedMediaType(request.content_type)
+
+        digest = None
+        if chunks is not None:
+            chunks = iter(chunks)
+            first = next(chunks, b"")
+            if first:
+                # Only images the workers can decode go to the store
+                if sniff_mime_type(first) is None:
+                    raise UnsupportedMediaType(request.content_type, "The body is not a PNG, JPEG or WebP image")
+                digest = image_store.put_stream(itertools.chain([first], chunks))
+        return save_upload(serializer, image_digest=digest)
+
 
+def metrics(request):
+    """Metrics of the service in the Prometheus text format"""
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,173 @@
+import logging
+import multiprocessing
+import os
+import threading
+
+from django.db import close_old_connections
+from django.db.models import F
+
+from .metrics import JOBS, observe_timings, registry
+from .models import ProcessingJob, Screenshot
+
+logger = logging.getLogger(__name__)
+
+# Attempts of a job before it is marked FAILED
+MAX_ATTEMPTS = 3
+
+# Set when a new job is queued so idle workers wake up without polling
+job_available = threading.Event()
+
+
+def notify_workers():
+    """Wake up the idle workers"""
+    job_available.set()
+
+
+def requeue_interrupted_jobs():
+    """Put back the jobs that were running when the service stopped"""
+    count = ProcessingJob.objects.filter(status="RUNNING").update(status="PENDING")
+    if count:
+        logger.info(f"Requeued {count} interrupted jobs")
+
+
+def claim_job() -> ProcessingJob | None:
+    """Mark the oldest pending job as running and return it"""
+    for job in ProcessingJob.objects.filter(status="PENDING").order_by("id")[:10]:
+        # Only one worker can win the update of a pending job
+        claimed = ProcessingJob.objects.filter(pk=job.pk, status="PENDING").update(
+            status="RUNNING", attempts=F("attempts") + 1
+        )
+        if claimed:
+            job.status = "RUNNING"
+            job.attempts += 1
+            return job
+    return None
+
+
+def run_job(job: ProcessingJob, max_attempts: int = MAX_ATTEMPTS):
+    """Process the screenshot of a job and remove the job when done"""
+    try:
+        screenshot = Screenshot.objects.get(pk=job.screenshot_id)
+        screenshot.process()
+        observe_timings(screenshot.timer, screenshot.screenshot_type)
+    except Screenshot.DoesNotExist:
+        logger.debug(f"Screenshot {job.screenshot_id} no longer exists")
+    except Exception as e:
+        logger.exception(f"Failed to process screenshot {job.screenshot_id}")
+        status = "FAILED" if job.attempts >= max_attempts else "PENDING"
+        ProcessingJob.objects.filter(pk=job.pk).update(status=status, error=str(e))
+        JOBS.inc(result=status.lower())
+        return
+
+    ProcessingJob.objects.filter(pk=job.pk).delete()
+    JOBS.inc(result="done")
+
+
+def work(poll_interval: int = 5):
+    """Process queued screenshots until the process exits"""
+    while True:
+        job = claim_job()
+        if job is None:
+            close_old_connections()
+            job_available.wait(poll_interval)
+            job_available.clear()
+            continue
+
+        run_job(job)
+
+
+def dispatch(jobs, poll_interval: int = 5):
+    """Hand the queued jobs to the worker processes over a local queue"""
+    while True:
+        job = claim_job()
+        if job is None:
+            close_old_connections()
+            job_available.wait(poll_interval)
+            job_available.clear()
+            continue
+
+        # Blocks while every worker process is busy
+        jobs.put(job.pk)
+
+
+def collect_metrics(results):
+    """Merge the metrics sent by the worker processes"""
+    while True:
+        pid, states = results.get()
+        registry.merge_remote(pid, states)
+
+
+def recover_job(job_id: int, reason: str, max_attempts: int = MAX_ATTEMPTS):
+    """Requeue a job left running by a dead worker, or fail it when out of attempts"""
+    job = ProcessingJob.objects.filter(pk=job_id, status="RUNNING").first()
+    if job is None:
+        return
+    status = "FAILED" if job.attempts >= max_attempts else "PENDING"
+    updated = ProcessingJob.objects.filter(pk=job.pk, status="RUNNING").update(status=status, error=reason)
+    if updated:
+        logger.warning(f"Job {job_id} interrupted ({reason}) - {status}")
+        JOBS.inc(result=status.lower())
+        if status == "PENDING":
+            notify_workers()
+
+
+def run_worker_process(jobs, results, threads: int):
+    """Run a worker process with threads inference threads and return when it exits"""
+    from .worker_process import process_worker_main
+
+    context = multiprocessing.get_context("spawn")
+    # Id of the job the process is working on, 0 when idle
+    current_job = context.Value("q", 0)
+    process = context.Process(
+        target=process_worker_main, args=(jobs, results, current_job, threads), daemon=True
+    )
+    process.start()
+    logger.info(f"Started inference worker process {process.pid}")
+    process.join()
+    logger.error(f"Inference worker process {process.pid} exited with {process.exitcode}")
+
+    # The job that killed the process would stay RUNNING until the next start
+    if current_job.value:
+        recover_job(current_job.value, f"Worker process exited with {process.exitcode}")
+
+
+def worker_services(count: int, mode: str = "thread") -> dict:
+    """
+    Build the thread_runner services of the worker pool
+    mode: "thread" to process in this process, "process" to use one process per worker
+    """
+    services = {}
+    if mode == "process":
+        # Each worker process owns its own models. The dispatcher claims the
+        # jobs and keeps at most one job waiting per worker.
+        context = multiprocessing.get_context("spawn")
+        jobs = context.Queue(maxsize=count)
+        results = context.Queue()
+        services["Dispatcher"] = {
+            "target": dispatch,
+            "args": (jobs,),
+            "kwargs": {},
+            "daemon": True,
+        }
+        services["Metrics collector"] = {
+            "target": collect_metrics,
+            "args": (results,),
+            "kwargs": {},
+            "daemon": True,
+        }
+        target = run_worker_process
+        # The processes split the cores instead of each using all of them
+        threads = max(1, (os.cpu_count() or 1) // count)
+        args = (jobs, results, threads)
+    else:
+        target = work
+        args = ()
+
+    for i in range(count):
+        services[f"Worker {i + 1}"] = {
+            "target": target,
+            "args": args,
+            "kwargs": {},
+            "daemon": True,
+        }
+    return services
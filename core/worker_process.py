@@ -0,0 +1,43 @@
+"""
+Entry point of the inference worker processes.
+
+This module is imported by freshly spawned processes before Django is set
+up, so it must not import any models at module level.
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def process_worker_main(jobs, results, current_job, threads):
+    """
+    Set up Django, load the models and process the job ids sent on jobs.
+    The metrics of the process are sent on results after every job and
+    current_job holds the id of the job being processed. Inference runs
+    on threads threads, the share of the CPU of the process.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "openchaver.settings")
+    import django
+
+    django.setup()
+
+    from django.db import close_old_connections
+    from core.metrics import registry
+    from core.models import ProcessingJob
+    from core.nudity import limit_threads, warm_up_models
+    from core.worker import run_job
+
+    logger.info(f"Inference worker {os.getpid()} started with {threads} threads")
+    limit_threads(threads)
+    warm_up_models()
+
+    while True:
+        job_id = jobs.get()
+        current_job.value = job_id
+        job = ProcessingJob.objects.filter(pk=job_id).first()
+        if job is not None:
+            run_job(job)
+            results.put((os.getpid(), registry.export()))
+        current_job.value = 0
+        close_old_connections()
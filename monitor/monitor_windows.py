@@ -1,10 +1,13 @@
 import time
+from urllib.parse import quote
+
 import requests
 import logging
 from openchaver.decorators import handle_error
 from .afk import seconds_since_last_input
 from .window import Window, UnstableWindow, NoWindowFound
 from openchaver.const import PORT
+from core.codec import codec_for
 logger = logging.getLogger(__name__)
 
 
@@ -32,16 +35,19 @@ class WindowMonitor:
     @handle_error
     def upload_screenshot(self, window: Window, screenshot_type="META"):
         """Upload the screenshot to the server"""
-        data = {
-            "title": window.title,
-            "excutable_name": window.exec_name,
-            "base64_image": window.take_screenshot()
-            if screenshot_type in ["IMAGE", "NSFW", "NSFW_IMAGE", "NSFW_META"]
-            else None,
-            "screenshot_type": screenshot_type,
+        # The image is sent as the raw body and the fields as headers
+        headers = {
+            "X-Title": quote(window.title, safe=""),
+            "X-Executable-Name": quote(window.exec_name, safe=""),
+            "X-Screenshot-Type": screenshot_type,
         }
+        data = None
+        if screenshot_type in ["IMAGE", "NSFW", "NSFW_IMAGE", "NSFW_META"]:
+            codec = codec_for(screenshot_type)
+            data = window.take_screenshot(codec)
+            headers["Content-Type"] = codec.mime_type
         response = requests.post(
-            f"http://localhost:{PORT}/api/screenshots/", json=data
+            f"http://localhost:{PORT}/api/screenshots/upload/", data=data, headers=headers
         )
         response.raise_for_status()
 
@@ -6,7 +6,7 @@ import numpy as np
 import cv2 as cv
 import mss
 
-from core.image_utils import encode_numpy_to_base64
+from core.codec import Codec, get_codec
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -48,8 +48,8 @@ class WindowBase:
     def __repr__(self):
         return self.title
 
-    def take_screenshot(self) -> str:
-        """Get a screenshot of the window"""
+    def take_screenshot(self, codec: Codec | None = None) -> bytes:
+        """Get a screenshot of the window encoded with codec, PNG by default"""
 
         # Get the coordinates of the window
         coordinates = self.get_coordinates()
@@ -65,7 +65,7 @@ class WindowBase:
             scale = self.dpi / self.DEFAULT_DPI
             image = cv.resize(image, None, fx=scale, fy=scale)
 
-        return encode_numpy_to_base64(image)
+        return (codec or get_codec("png")).encode(image)
 
     def stable_check(self) -> None:
         """Check if the window is stable"""
@@ -45,6 +45,70 @@ MONITOR_COMMAND = [str(BASE_EXE)] + MONITOR_ARGS
 
 PORT = 61313
 
+# Number of background workers processing the uploaded screenshots
+WORKER_COUNT = 2
+# "thread" runs the workers inside the service, "process" gives every worker
+# its own process and models so inference scales across CPU cores
+WORKER_MODE = "thread"
+
+# ONNX Runtime session options of the detector
+# A thread count of 0 lets ONNX Runtime use every core. Worker processes
+# split the cores between them instead, unless a count is set here.
+ONNX_INTRA_OP_THREADS = 0
+ONNX_INTER_OP_THREADS = 0
+ONNX_EXECUTION_MODE = "sequential"  # "sequential" or "parallel"
+ONNX_GRAPH_OPTIMIZATION = "all"  # "disabled", "basic", "extended" or "all"
+
+# Precision of the NSFW models. "int8" runs a locally quantized copy which
+# is faster on older CPUs. Compare both with `manage.py comparemodels`.
+CLASSIFICATION_MODEL_PRECISION = "fp32"  # "fp32" or "int8"
+DETECTION_MODEL_PRECISION = "fp32"  # "fp32" or "int8"
+
+# NSFW cascade
+# Crops with a classifier score at or below LOW are safe and crops at or above
+# HIGH are NSFW, both without running the detector. Crops in between run the
+# fast detector, and again at full resolution when the best NSFW detection
+# score of the fast pass falls inside the AMBIGUOUS range.
+CASCADE_CLASSIFIER_LOW = 0.6
+CASCADE_CLASSIFIER_HIGH = 0.98
+CASCADE_DETECTOR_AMBIGUOUS = (0.3, 0.6)
+
+# Number of NSFW results kept in memory for repeated frames and crops
+RESULT_CACHE_SIZE = 2048
+
+# Image codec of the captures sent by the monitor, per screenshot type.
+# "png" and "webp" are lossless, "jpeg" is lossy. The NSFW types are analysed
+# on the decoded pixels so they default to lossless, archived IMAGE captures
+# only need to be viewable. Measure with `python -m benchmarks.bench_codecs`.
+CAPTURE_CODECS = {
+    "IMAGE": "jpeg",
+    "NSFW": "png",
+    "NSFW_IMAGE": "png",
+    "NSFW_META": "png",
+}
+PNG_COMPRESSION = 1  # 0 (fastest, largest) to 9 (slowest, smallest)
+JPEG_QUALITY = 85  # 0 to 100
+
+# Window sessions
+# Uploads of the same window less than SESSION_GAP seconds after the end of
+# its session extend the session instead of starting a new one
+SESSION_GAP = 10
+
+# SQLite settings applied to every database connection. WAL lets the API and
+# the admin read while a worker writes. With WAL, NORMAL only syncs at
+# checkpoints: a power loss can drop the last transactions but doesn't
+# corrupt the database.
+SQLITE_PRAGMAS = {
+    "busy_timeout": 5000,  # Milliseconds to wait for a lock before failing
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,  # Bytes of the database read through mmap, shared by every connection
+    # Page cache of each connection, negative values are in KiB. Every worker
+    # thread and process has its own, so keep it small.
+    "cache_size": -8 * 1024,
+    "temp_store": "MEMORY",
+}
+
 # Log all variables to the service log
 logger.info("BASE_EXE: %s", BASE_EXE)
 logger.info("TESTING: %s", TESTING)
@@ -64,6 +128,23 @@ logger.info("SERVICE_COMMAND: %s", SERVICE_COMMAND)
 logger.info("WATCHER_COMMAND: %s", WATCHER_COMMAND)
 logger.info("MONITOR_COMMAND: %s", MONITOR_COMMAND)
 logger.info("PORT: %s", PORT)
+logger.info("WORKER_COUNT: %s", WORKER_COUNT)
+logger.info("WORKER_MODE: %s", WORKER_MODE)
+logger.info("ONNX_INTRA_OP_THREADS: %s", ONNX_INTRA_OP_THREADS)
+logger.info("ONNX_INTER_OP_THREADS: %s", ONNX_INTER_OP_THREADS)
+logger.info("ONNX_EXECUTION_MODE: %s", ONNX_EXECUTION_MODE)
+logger.info("ONNX_GRAPH_OPTIMIZATION: %s", ONNX_GRAPH_OPTIMIZATION)
+logger.info("CLASSIFICATION_MODEL_PRECISION: %s", CLASSIFICATION_MODEL_PRECISION)
+logger.info("DETECTION_MODEL_PRECISION: %s", DETECTION_MODEL_PRECISION)
+logger.info("CASCADE_CLASSIFIER_LOW: %s", CASCADE_CLASSIFIER_LOW)
+logger.info("CASCADE_CLASSIFIER_HIGH: %s", CASCADE_CLASSIFIER_HIGH)
+logger.info("CASCADE_DETECTOR_AMBIGUOUS: %s", CASCADE_DETECTOR_AMBIGUOUS)
+logger.info("RESULT_CACHE_SIZE: %s", RESULT_CACHE_SIZE)
+logger.info("CAPTURE_CODECS: %s", CAPTURE_CODECS)
+logger.info("PNG_COMPRESSION: %s", PNG_COMPRESSION)
+logger.info("JPEG_QUALITY: %s", JPEG_QUALITY)
+logger.info("SESSION_GAP: %s", SESSION_GAP)
+logger.info("SQLITE_PRAGMAS: %s", SQLITE_PRAGMAS)
 
 
 
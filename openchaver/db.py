@@ -0,0 +1,22 @@
+"""
+Performance settings of the SQLite database.
+
+The pragmas of openchaver.const.SQLITE_PRAGMAS are applied to every new
+connection. core.apps connects the receiver when Django starts.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to a new database connection"""
+    from .const import SQLITE_PRAGMAS
+
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    logger.debug(f"Configured SQLite connection {connection.alias}")
@@ -79,10 +79,17 @@ WSGI_APPLICATION = "openchaver.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# The connection pragmas are applied by openchaver.db
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": get_install_dir() / "db.sqlite3",
+        # Keep the connections of the long lived worker threads and processes
+        # open instead of reconnecting and re-applying the pragmas. runserver
+        # closes the connection of every request thread, so this doesn't
+        # apply to the API and the admin.
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 